@@ -23,7 +23,7 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from compiler import (
     compile_spl, SymbolTable, Lexer, Parser, ScopeAnalyzer, 
-    TypeAnalyzer, CodeGenerator, process_labels_and_jumps
+    TypeAnalyzer, CodeGenerator, named_label_map
 )
 
 
@@ -102,9 +102,10 @@ class LabelJumpTestRunner:
             if should_have_labels and not has_labels:
                 print(f"⚠️  WARNING: Expected labels in intermediate code but found none")
             
-            # Process labels and jumps
+            # Labels and jumps were resolved by the generator's assemble()
             print("\n--- PROCESSING LABELS AND JUMPS ---")
-            final_code, label_map = process_labels_and_jumps(intermediate_code)
+            final_code = code_generator.final_code
+            label_map = named_label_map(code_generator.label_lines)
             
             print(f"\nLabel Mapping:")
             for label, line_num in sorted(label_map.items(), key=lambda x: x[1]):
@@ -133,25 +134,23 @@ class LabelJumpTestRunner:
             
             # Check 2: All GOTOs and THENs should have numeric targets
             for i, line in enumerate(final_code, 1):
-                if 'GOTO ' in line:
-                    parts = line.split('GOTO ')
-                    if len(parts) > 1:
-                        target = parts[1].strip().split()[0]
-                        if not target.isdigit():
-                            print(f"❌ ERROR: Line {i} - GOTO target is not numeric: {target}")
-                            success = False
-                        else:
-                            print(f"✓ Line {i} - GOTO {target} (valid)")
+                _, sep, tail = line.partition('GOTO ')
+                if sep:
+                    target = tail.split(None, 1)[0]
+                    if not target.isdigit():
+                        print(f"❌ ERROR: Line {i} - GOTO target is not numeric: {target}")
+                        success = False
+                    else:
+                        print(f"✓ Line {i} - GOTO {target} (valid)")
                 
-                if 'THEN ' in line:
-                    parts = line.split('THEN ')
-                    if len(parts) > 1:
-                        target = parts[1].strip().split()[0]
-                        if not target.isdigit():
-                            print(f"❌ ERROR: Line {i} - THEN target is not numeric: {target}")
-                            success = False
-                        else:
-                            print(f"✓ Line {i} - THEN {target} (valid)")
+                _, sep, tail = line.partition('THEN ')
+                if sep:
+                    target = tail.split(None, 1)[0]
+                    if not target.isdigit():
+                        print(f"❌ ERROR: Line {i} - THEN target is not numeric: {target}")
+                        success = False
+                    else:
+                        print(f"✓ Line {i} - THEN {target} (valid)")
             
             # Check 3: Expected patterns
             if expected_patterns:
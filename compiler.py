@@ -9,11 +9,14 @@ Requirements:
     pip install antlr4-python3-runtime
 """
 
-from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Set, Any, Tuple
+from dataclasses import dataclass, field, fields
+from typing import AbstractSet, Callable, ClassVar, Dict, List, NoReturn, Optional, Set, Any, Tuple, Union
 from enum import Enum
 import sys
 import os
+import re
+import itertools
+from array import array
 
 # ============================================================================
 # ENUMS AND DATA STRUCTURES
@@ -59,10 +62,24 @@ class FunctionInfo:
 # SYMBOL TABLE
 # ============================================================================
 
+# Scope contexts that see the same variables share one lookup bucket;
+# None (no scope open) buckets the most recent symbol of any kind
+_LOOKUP_BUCKET = {
+    None: None,
+    ScopeType.LOCAL: ScopeType.LOCAL,
+    ScopeType.PROCEDURE: ScopeType.LOCAL,
+    ScopeType.FUNCTION: ScopeType.LOCAL,
+    ScopeType.MAIN: ScopeType.MAIN,
+    ScopeType.GLOBAL: ScopeType.GLOBAL,
+}
+
 class SymbolTable:
     def __init__(self):
         self.symbols: Dict[int, SymbolInfo] = {}
         self.var_lookup: Dict[str, List[SymbolInfo]] = {}  # name -> list of symbols
+        # name -> lookup bucket -> symbol lookup_var returns there
+        self.scope_index: Dict[str, Dict[Optional[ScopeType], SymbolInfo]] = {}
+        self.lookup_names: Dict[int, str] = {}  # node_id -> var_lookup key it is filed under
         self.functions: Dict[str, FunctionInfo] = {}
         self.procedures: Dict[str, FunctionInfo] = {}
         self.global_vars: Set[str] = set()
@@ -79,6 +96,11 @@ class SymbolTable:
     def get_node_id(self) -> int:
         self.node_counter += 1
         return self.node_counter
+    
+    def reserve_node_ids(self, count: int) -> range:
+        start = self.node_counter + 1
+        self.node_counter += count
+        return range(start, start + count)
         
     def new_temp(self) -> str:
         self.temp_counter += 1
@@ -157,41 +179,69 @@ class SymbolTable:
         if symbol.name not in self.var_lookup:
             self.var_lookup[symbol.name] = []
         self.var_lookup[symbol.name].append(symbol)
+        self.lookup_names[symbol.node_id] = symbol.name
+        self.index_symbol(symbol.name, symbol)
         
         if self.scope_stack:
             self.scope_stack[-1]['symbols'].append(symbol.node_id)
         
         return True
     
+    def add_symbols_bulk(self, symbols: List[SymbolInfo]) -> bool:
+        # Same outcome as add_symbol one at a time: the first symbol with a
+        # node_id wins, whether the clash is with the table or the batch
+        existing = self.symbols
+        fresh: Dict[int, SymbolInfo] = {}
+        for symbol in symbols:
+            if symbol.node_id in existing or symbol.node_id in fresh:
+                self.add_warning(f"Attempted to add duplicate node_id {symbol.node_id}")
+            else:
+                fresh[symbol.node_id] = symbol
+        
+        existing.update(fresh)
+        
+        for symbol in fresh.values():
+            self.var_lookup.setdefault(symbol.name, []).append(symbol)
+            self.lookup_names[symbol.node_id] = symbol.name
+            self.index_symbol(symbol.name, symbol)
+        
+        if self.scope_stack:
+            self.scope_stack[-1]['symbols'].extend(fresh)
+        
+        return len(fresh) == len(symbols)
+    
+    def index_symbol(self, name: str, symbol: SymbolInfo):
+        # a later symbol shadows earlier ones in every bucket it is visible in
+        buckets = self.scope_index.setdefault(name, {})
+        buckets[None] = symbol
+        if symbol.is_global:
+            buckets[ScopeType.LOCAL] = buckets[ScopeType.MAIN] = buckets[ScopeType.GLOBAL] = symbol
+            return
+        if symbol.is_local or symbol.is_parameter:
+            buckets[ScopeType.LOCAL] = symbol
+        if symbol.is_main_var:
+            buckets[ScopeType.MAIN] = symbol
+    
+    def reindex_name(self, name: str):
+        self.scope_index.pop(name, None)
+        for symbol in self.var_lookup.get(name, ()):
+            self.index_symbol(name, symbol)
+    
     # READ
     def get_symbol(self, node_id: int) -> Optional[SymbolInfo]:
         return self.symbols.get(node_id)
     
     def lookup_var(self, name: str, scope_context: ScopeType = None) -> Optional[SymbolInfo]:
-        if name not in self.var_lookup:
+        buckets = self.scope_index.get(name)
+        if buckets is None:
             return None
         
         if scope_context is None:
             scope_context = self.current_scope_type
         
-        if scope_context is None:
-            return self.var_lookup[name][-1] if self.var_lookup[name] else None
-        
-        for sym in reversed(self.var_lookup[name]):
-            if scope_context == ScopeType.LOCAL:
-                if sym.is_local or sym.is_parameter or sym.is_global:
-                    return sym
-            elif scope_context == ScopeType.MAIN:
-                if sym.is_main_var or sym.is_global:
-                    return sym
-            elif scope_context == ScopeType.GLOBAL:
-                if sym.is_global:
-                    return sym
-            elif scope_context in (ScopeType.PROCEDURE, ScopeType.FUNCTION):
-                if sym.is_local or sym.is_parameter or sym.is_global:
-                    return sym
-        
-        return None
+        if scope_context not in _LOOKUP_BUCKET:
+            return None
+        return buckets.get(_LOOKUP_BUCKET[scope_context])
     
     def get_symbol_by_name(self, name: str, scope: ScopeType = None) -> Optional[SymbolInfo]:
         if name not in self.var_lookup:
@@ -215,6 +265,8 @@ class SymbolTable:
                 setattr(symbol, field, value)
             else:
                 self.add_warning(f"Unknown field '{field}' in update_symbol")
+        # the scope flags decide which buckets the symbol is visible in
+        self.reindex_name(self.lookup_names.get(node_id, symbol.name))
         return True
     
     # DELETE
@@ -231,6 +283,8 @@ class SymbolTable:
             ]
             if not self.var_lookup[symbol.name]:
                 del self.var_lookup[symbol.name]
+            self.reindex_name(symbol.name)
+        self.lookup_names.pop(node_id, None)
         
         for scope in self.scope_stack:
             if node_id in scope['symbols']:
@@ -246,6 +300,8 @@ class SymbolTable:
     def clear(self):
         self.symbols.clear()
         self.var_lookup.clear()
+        self.scope_index.clear()
+        self.lookup_names.clear()
         self.functions.clear()
         self.procedures.clear()
         self.global_vars.clear()
@@ -273,26 +329,42 @@ class SymbolTable:
 # AST NODE DEFINITIONS
 # ============================================================================
 
-@dataclass
+# Nodes carry __slots__ instead of a per-instance __dict__ where dataclasses
+# can generate them (Python 3.10+)
+ast_node = dataclass(slots=True) if sys.version_info >= (3, 10) else dataclass
+
+# Integer tag per node class (the class attribute KIND). The passes key
+# their dispatch tables and node tests on it instead of the node's class.
+(KIND_NODE, KIND_HALT, KIND_PRINT, KIND_CALL, KIND_ASSIGN, KIND_LOOP, KIND_BRANCH,
+ KIND_ATOM_TERM, KIND_UNOP_TERM, KIND_BINOP_TERM) = range(10)
+# Terms built from an operator and operand terms
+_OP_TERM_KINDS = frozenset((KIND_UNOP_TERM, KIND_BINOP_TERM))
+
+def node_kind(value: Any) -> int:
+    """KIND of value, or KIND_NODE for anything that is not a tagged node (e.g. None)"""
+    return getattr(value, 'KIND', KIND_NODE)
+
+@ast_node
 class ASTNode:
+    KIND: ClassVar[int] = KIND_NODE
     node_id: int = 0
     line: int = 0
     
-@dataclass
+@ast_node
 class ProgramNode(ASTNode):
     variables: List[str] = field(default_factory=list)
     procedures: List['ProcDefNode'] = field(default_factory=list)
     functions: List['FuncDefNode'] = field(default_factory=list)
     main: Optional['MainProgNode'] = None
 
-@dataclass
+@ast_node
 class ProcDefNode(ASTNode):
     name: str = ""
     params: List[str] = field(default_factory=list)
     local_vars: List[str] = field(default_factory=list)
     body: Optional['AlgoNode'] = None
 
-@dataclass
+@ast_node
 class FuncDefNode(ASTNode):
     name: str = ""
     params: List[str] = field(default_factory=list)
@@ -300,75 +372,141 @@ class FuncDefNode(ASTNode):
     body: Optional['AlgoNode'] = None
     return_atom: Optional['AtomNode'] = None
 
-@dataclass
+@ast_node
 class MainProgNode(ASTNode):
     variables: List[str] = field(default_factory=list)
     body: Optional['AlgoNode'] = None
 
-@dataclass
+@ast_node
 class AlgoNode(ASTNode):
     instructions: List['InstrNode'] = field(default_factory=list)
 
-@dataclass
+# Shared by every empty block instead of a fresh node each; never mutated
+EMPTY_ALGO = AlgoNode(instructions=())
+
+@ast_node
 class InstrNode(ASTNode):
     pass
 
-@dataclass
+@ast_node
 class HaltNode(InstrNode):
-    pass
+    KIND: ClassVar[int] = KIND_HALT
 
-@dataclass
+# PrintNode.kind tags
+PRINT_STRING = 0
+PRINT_VAR = 1
+PRINT_NUM = 2
+
+@ast_node
 class PrintNode(InstrNode):
+    KIND: ClassVar[int] = KIND_PRINT
     output: Any = None
     is_string: bool = False
+    kind: Optional[int] = field(default=None, compare=False, repr=False)  # PRINT_* tag, set by the parser
 
-@dataclass
+@ast_node
 class CallNode(InstrNode):
+    KIND: ClassVar[int] = KIND_CALL
     name: str = ""
     args: List['AtomNode'] = field(default_factory=list)
 
-@dataclass
+@ast_node
 class AssignNode(InstrNode):
+    KIND: ClassVar[int] = KIND_ASSIGN
     var: str = ""
     expr: Any = None  # TermNode or CallNode
     is_func_call: bool = False
 
-@dataclass
+@ast_node
 class LoopNode(InstrNode):
+    KIND: ClassVar[int] = KIND_LOOP
     condition: Optional['TermNode'] = None
     body: Optional['AlgoNode'] = None
     is_while: bool = True
 
-@dataclass
+@ast_node
 class BranchNode(InstrNode):
+    KIND: ClassVar[int] = KIND_BRANCH
     condition: Optional['TermNode'] = None
     then_branch: Optional['AlgoNode'] = None
     else_branch: Optional['AlgoNode'] = None
 
-@dataclass
+@ast_node
 class AtomNode(ASTNode):
     value: Any = None
     is_var: bool = True
 
-@dataclass
+@ast_node
 class TermNode(ASTNode):
-    pass
+    var_type: Optional[VarType] = field(default=None, compare=False, repr=False)  # Set by type analysis
+    cse_key: Optional[tuple] = field(default=None, compare=False, repr=False)  # Cached by term_key
+    type_pass: int = field(default=0, compare=False, repr=False)  # Type-analysis pass var_type is from
 
-@dataclass
+@ast_node
 class AtomTermNode(TermNode):
+    KIND: ClassVar[int] = KIND_ATOM_TERM
     atom: Optional[AtomNode] = None
 
-@dataclass
+@ast_node
 class UnopTermNode(TermNode):
+    KIND: ClassVar[int] = KIND_UNOP_TERM
     op: str = ""
     term: Optional[TermNode] = None
 
-@dataclass
+@ast_node
 class BinopTermNode(TermNode):
+    KIND: ClassVar[int] = KIND_BINOP_TERM
     op: str = ""
     left: Optional[TermNode] = None
     right: Optional[TermNode] = None
 
+# Fields that do not describe source structure
+_CONTENT_SKIP_FIELDS = frozenset({'node_id', 'line', 'var_type', 'type_pass', 'cse_key', 'kind'})
+
+def ast_content_key(node: Any) -> Any:
+    """
+    Structural key for an AST subtree. Node ids, line numbers and analysis
+    results are ignored, so an unchanged definition gets the same key
+    after the program is re-parsed.
+    """
+    if isinstance(node, ASTNode):
+        return (type(node).__name__,) + tuple(
+            ast_content_key(getattr(node, f.name))
+            for f in fields(node) if f.name not in _CONTENT_SKIP_FIELDS
+        )
+    if isinstance(node, list):
+        return tuple(ast_content_key(item) for item in node)
+    return node
+
+def term_key(term: 'TermNode') -> tuple:
+    """
+    Canonical key of a term: structurally identical terms get equal keys.
+    Computed once per node and cached on it.
+    """
+    key = term.cse_key
+    if key is None:
+        kind = term.KIND
+        if kind == KIND_ATOM_TERM:
+            key = ('atom', term.atom.is_var, term.atom.value)
+        elif kind == KIND_UNOP_TERM:
+            key = ('unop', term.op, term_key(term.term))
+        elif kind == KIND_BINOP_TERM:
+            key = ('binop', term.op, term_key(term.left), term_key(term.right))
+        else:
+            key = ('node', id(term))
+        term.cse_key = key
+    return key
+
+def term_key_vars(key: tuple) -> Set[str]:
+    """Variable names read by the term a term_key() describes"""
+    if key[0] == 'atom':
+        return {key[2]} if key[1] else set()
+    if key[0] == 'unop':
+        return term_key_vars(key[2])
+    if key[0] == 'binop':
+        return term_key_vars(key[2]) | term_key_vars(key[3])
+    return set()
+
 # ============================================================================
 # LEXER
 # ============================================================================
@@ -388,6 +526,11 @@ class Lexer:
         'halt', 'print', 'if', 'else', 'while', 'do', 'until',
         'neg', 'not', 'eq', 'or', 'and', 'plus', 'minus', 'mult', 'div'
     }
+    # ASCII scanners; a run that stops at a non-ASCII character is rescanned
+    # by the character loops, which follow str.islower/str.isdigit exactly
+    _WHITESPACE_RE = re.compile(r'[ \t\n\r]*')
+    _NUMBER_RE = re.compile(r'[0-9]*')
+    _IDENT_RE = re.compile(r'[a-z]*[0-9]*')
     
     def __init__(self, text: str):
         self.text = text
@@ -396,48 +539,59 @@ class Lexer:
         self.tokens: List[Token] = []
         
     def tokenize(self) -> List[Token]:
-        while self.pos < len(self.text):
-            self.skip_whitespace()
-            if self.pos >= len(self.text):
-                break
-                
-            # Comments
-            if self.pos < len(self.text) - 1 and self.text[self.pos:self.pos+2] == '//':
-                self.skip_line()
-                continue
-                
-            # String literals
-            if self.current() == '"':
-                self.tokens.append(self.read_string())
-                continue
-                
-            # Numbers
-            if self.current().isdigit():
-                self.tokens.append(self.read_number())
-                continue
-                
-            # Identifiers and keywords - SPL Vocabulary Rules
-            if self.current().isalpha() and self.current().islower():
-                self.tokens.append(self.read_identifier())
-                continue
-            
-            # Reject uppercase letters - not allowed in SPL vocabulary
-            if self.current().isupper():
-                raise ValueError(f"Vocabulary violation: Uppercase letter '{self.current()}' not allowed in SPL at line {self.line}")
-                
-            # Symbols
-            c = self.current()
-            if c in '(){}[];=><':
-                self.tokens.append(Token('SYMBOL', c, self.line))
-                self.pos += 1
-                continue
-                
-            # Unknown character - this is a vocabulary violation in SPL
-            raise ValueError(f"Vocabulary violation: Invalid character '{c}' at line {self.line}, position {self.pos}")
+        # one table lookup on the current character picks the scanner;
+        # non-ASCII characters go through the general character tests
+        text = self.text
+        dispatch = self._DISPATCH
+        while self.pos < len(text):
+            c = text[self.pos]
+            if c < '\x80':
+                dispatch[ord(c)](self)
+            else:
+                self.lex_other()
             
         self.tokens.append(Token('EOF', '', self.line))
         return self.tokens
         
+    def lex_string(self):
+        self.tokens.append(self.read_string())
+        
+    def lex_number(self):
+        self.tokens.append(self.read_number())
+        
+    def lex_identifier(self):
+        self.tokens.append(self.read_identifier())
+        
+    def lex_symbol(self):
+        self.tokens.append(Token('SYMBOL', self.text[self.pos], self.line))
+        self.pos += 1
+        
+    def lex_slash(self):
+        # Comments
+        if self.text[self.pos:self.pos+2] == '//':
+            self.skip_line()
+        else:
+            self.lex_invalid()
+            
+    def lex_uppercase(self):
+        # Reject uppercase letters - not allowed in SPL vocabulary
+        raise ValueError(f"Vocabulary violation: Uppercase letter '{self.current()}' not allowed in SPL at line {self.line}")
+        
+    def lex_invalid(self):
+        # Unknown character - this is a vocabulary violation in SPL
+        raise ValueError(f"Vocabulary violation: Invalid character '{self.current()}' at line {self.line}, position {self.pos}")
+        
+    def lex_other(self):
+        c = self.current()
+        if c.isdigit():
+            self.lex_number()
+        elif c.isalpha() and c.islower():
+            self.lex_identifier()
+        elif c.isupper():
+            self.lex_uppercase()
+        else:
+            self.lex_invalid()
+        
     def current(self) -> str:
         return self.text[self.pos] if self.pos < len(self.text) else ''
         
@@ -448,10 +602,10 @@ class Lexer:
         return self.text[self.pos:end_pos]
         
     def skip_whitespace(self):
-        while self.pos < len(self.text) and self.text[self.pos] in ' \t\n\r':
-            if self.text[self.pos] == '\n':
-                self.line += 1
-            self.pos += 1
+        end = self._WHITESPACE_RE.match(self.text, self.pos).end()
+        if end != self.pos:
+            self.line += self.text.count('\n', self.pos, end)
+            self.pos = end
             
     def skip_line(self):
         while self.pos < len(self.text) and self.text[self.pos] not in '\n\r':
@@ -483,6 +637,13 @@ class Lexer:
         start = self.pos
         start_line = self.line
         
+        end = self._NUMBER_RE.match(self.text, start).end()
+        if end != start and (end == len(self.text) or self.text[end].isascii()):
+            if self.text[start] == '0' and end - start > 1:
+                raise ValueError(f"Invalid number format: leading zero not allowed except for '0' at line {start_line}")
+            self.pos = end
+            return Token('NUMBER', self.text[start:end], start_line)
+        
         if self.text[self.pos] == '0':
             self.pos += 1
             if self.pos < len(self.text) and self.text[self.pos].isdigit():
@@ -503,10 +664,14 @@ class Lexer:
         if self.pos >= len(self.text) or not self.text[self.pos].islower():
             raise ValueError(f"Invalid identifier start at position {self.pos}")
         
-        while self.pos < len(self.text) and self.text[self.pos].islower():
-            self.pos += 1
-        while self.pos < len(self.text) and self.text[self.pos].isdigit():
-            self.pos += 1
+        end = self._IDENT_RE.match(self.text, start).end()
+        if end == len(self.text) or self.text[end].isascii():
+            self.pos = end
+        else:
+            while self.pos < len(self.text) and self.text[self.pos].islower():
+                self.pos += 1
+            while self.pos < len(self.text) and self.text[self.pos].isdigit():
+                self.pos += 1
             
         value = self.text[start:self.pos]
         if len(value) == 0:
@@ -515,41 +680,134 @@ class Lexer:
             return Token('KEYWORD', value, start_line)
         return Token('ID', value, start_line)
 
+def _lexer_dispatch() -> Tuple[Callable[[Lexer], None], ...]:
+    """Scanner for each ASCII character, indexed by its code"""
+    table = [Lexer.lex_invalid] * 128
+    for c in ' \t\n\r':
+        table[ord(c)] = Lexer.skip_whitespace
+    for c in '0123456789':
+        table[ord(c)] = Lexer.lex_number
+    for c in 'abcdefghijklmnopqrstuvwxyz':
+        table[ord(c)] = Lexer.lex_identifier
+    for c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ':
+        table[ord(c)] = Lexer.lex_uppercase
+    for c in '(){}[];=><':
+        table[ord(c)] = Lexer.lex_symbol
+    table[ord('"')] = Lexer.lex_string
+    table[ord('/')] = Lexer.lex_slash
+    return tuple(table)
+
+Lexer._DISPATCH = _lexer_dispatch()
+
 # ============================================================================
 # PARSER
 # ============================================================================
 
+# Token values and types the parser matches on, interned so that they can
+# be compared by identity with the (also interned) token fields
+KW_GLOB = sys.intern('glob')
+KW_PROC = sys.intern('proc')
+KW_FUNC = sys.intern('func')
+KW_MAIN = sys.intern('main')
+KW_VAR = sys.intern('var')
+KW_LOCAL = sys.intern('local')
+KW_RETURN = sys.intern('return')
+KW_HALT = sys.intern('halt')
+KW_PRINT = sys.intern('print')
+KW_IF = sys.intern('if')
+KW_ELSE = sys.intern('else')
+KW_WHILE = sys.intern('while')
+KW_DO = sys.intern('do')
+KW_UNTIL = sys.intern('until')
+KW_NEG = sys.intern('neg')
+KW_NOT = sys.intern('not')
+SYM_LPAREN = sys.intern('(')
+SYM_RPAREN = sys.intern(')')
+SYM_LBRACE = sys.intern('{')
+SYM_RBRACE = sys.intern('}')
+SYM_SEMI = sys.intern(';')
+SYM_ASSIGN = sys.intern('=')
+TOK_ID = sys.intern('ID')
+TOK_NUMBER = sys.intern('NUMBER')
+TOK_STRING = sys.intern('STRING')
+
+# Frame kinds of parse_term's stack: '(' UNOP, '(' BINOP prefix form,
+# '(' awaiting a left operand, and infix BINOP awaiting its right operand
+_TERM_UNOP, _TERM_PREFIX, _TERM_INFIX, _TERM_RIGHT = range(4)
+
+# Operators that open a UNOP / BINOP term
+_UNOPS = frozenset((KW_NEG, KW_NOT))
+_BINOPS = frozenset(map(sys.intern, ('eq', '>', 'or', 'and', 'plus', 'minus', 'mult', 'div')))
+
+def _consumer(expected: str) -> Callable[['Parser'], str]:
+    """Parser.consume(expected) specialized for one fixed, interned token"""
+    def consume_expected(self: 'Parser') -> str:
+        value = self.values[self.pos]
+        if value is not expected:
+            self.error(f"Expected '{expected}', got '{value}'")
+        self.pos += 1
+        return value
+    return consume_expected
+
 class Parser:
     def __init__(self, tokens: List[Token], symbol_table: SymbolTable):
-        self.tokens = tokens
-        self.pos = 0
-        self.st = symbol_table
-        
-    def error(self, msg: str):
-        tok = self.current()
-        raise SyntaxError(f"Line {tok.line}: {msg}")
+        self.tokens: List[Token] = tokens
+        # Tokens are read-only while parsing, so their fields are kept in
+        # parallel lists indexed by pos. The last token (EOF) is repeated as
+        # a sentinel: nothing consumes EOF, so pos never runs off the end.
+        # Values and types are interned, so match/match_type/consume can
+        # compare them by identity with the constants above
+        tail = tokens[-1:]
+        intern = sys.intern
+        self.values: List[str] = [intern(t.value) for t in tokens] + [intern(t.value) for t in tail]
+        self.types: List[str] = [intern(t.type) for t in tokens] + [intern(t.type) for t in tail]
+        self.lines: List[int] = [t.line for t in tokens] + [t.line for t in tail]
+        self.pos: int = 0
+        self.st: SymbolTable = symbol_table
+        # bound once; every node draws its id through it
+        self.get_node_id: Callable[[], int] = symbol_table.get_node_id
+        
+    def error(self, msg: str) -> NoReturn:
+        raise SyntaxError(f"Line {self.current().line}: {msg}")
         
     def current(self) -> Token:
         return self.tokens[self.pos] if self.pos < len(self.tokens) else self.tokens[-1]
         
-    def peek(self, offset=1) -> Token:
+    def peek(self, offset: int = 1) -> Token:
         idx = self.pos + offset
         return self.tokens[idx] if idx < len(self.tokens) else self.tokens[-1]
         
-    def consume(self, expected: str = None) -> Token:
-        tok = self.current()
-        if expected and tok.value != expected:
-            self.error(f"Expected '{expected}', got '{tok.value}'")
+    def peek_value(self, offset: int) -> str:
+        # only called ahead of an unconsumed non-EOF token, so the EOF
+        # sentinel keeps pos + 1 in range
+        return self.values[self.pos + offset]
+        
+    def consume(self, expected: Optional[str] = None) -> str:
+        value = self.values[self.pos]
+        # identity settles the interned constants; == only runs for an
+        # equal string built elsewhere, or just before a syntax error
+        if expected and value is not expected and value != expected:
+            self.error(f"Expected '{expected}', got '{value}'")
         self.pos += 1
-        return tok
+        return value
         
+    # The brackets are consumed most often, so they get their own consumers
+    consume_lbrace = _consumer(SYM_LBRACE)
+    consume_rbrace = _consumer(SYM_RBRACE)
+    consume_lparen = _consumer(SYM_LPAREN)
+    consume_rparen = _consumer(SYM_RPAREN)
+        
+    # Interned constants match by identity; any other equal string still
+    # matches through the == fallback
     def match(self, value: str) -> bool:
-        return self.current().value == value
+        current = self.values[self.pos]
+        return current is value or current == value
         
     def match_type(self, type_: str) -> bool:
-        return self.current().type == type_
+        current = self.types[self.pos]
+        return current is type_ or current == type_
         
-    def parse(self) -> ProgramNode:
+    def parse(self) -> Optional[ProgramNode]:
         try:
             return self.parse_program()
         except SyntaxError as e:
@@ -557,315 +815,436 @@ class Parser:
             return None
         
     def parse_program(self) -> ProgramNode:
-        node = ProgramNode(node_id=self.st.get_node_id(), line=self.current().line)
-        
-        self.consume('glob')
-        self.consume('{')
-        node.variables = self.parse_variables()
-        self.consume('}')
-        
-        self.consume('proc')
-        self.consume('{')
-        node.procedures = self.parse_procdefs()
-        self.consume('}')
-        
-        self.consume('func')
-        self.consume('{')
-        node.functions = self.parse_funcdefs()
-        self.consume('}')
-        
-        self.consume('main')
-        self.consume('{')
-        node.main = self.parse_mainprog()
-        self.consume('}')
-        
-        return node
+        # Every parse_* method reads all of a node's fields first and builds
+        # the node in one constructor call; node ids are still taken in the
+        # same order, before the children are parsed
+        node_id = self.get_node_id()
+        line = self.lines[self.pos]
+        
+        self.consume(KW_GLOB)
+        self.consume_lbrace()
+        variables = self.parse_variables()
+        self.consume_rbrace()
+        
+        self.consume(KW_PROC)
+        self.consume_lbrace()
+        procedures = self.parse_procdefs()
+        self.consume_rbrace()
+        
+        self.consume(KW_FUNC)
+        self.consume_lbrace()
+        functions = self.parse_funcdefs()
+        self.consume_rbrace()
+        
+        self.consume(KW_MAIN)
+        self.consume_lbrace()
+        main = self.parse_mainprog()
+        self.consume_rbrace()
+        
+        return ProgramNode(node_id=node_id, line=line, variables=variables,
+                           procedures=procedures, functions=functions, main=main)
         
     def parse_variables(self) -> List[str]:
-        vars = []
-        while self.match_type('ID'):
-            vars.append(self.consume().value)
-        return vars
+        # find the end of the ID run, then take it with one slice
+        start = end = self.pos
+        types = self.types
+        while types[end] is TOK_ID:
+            end += 1
+        self.pos = end
+        return self.values[start:end]
         
     def parse_procdefs(self) -> List[ProcDefNode]:
-        procs = []
-        while self.match_type('ID'):
+        procs: List[ProcDefNode] = []
+        types = self.types
+        while types[self.pos] is TOK_ID:
             procs.append(self.parse_pdef())
         return procs
         
     def parse_pdef(self) -> ProcDefNode:
-        node = ProcDefNode(node_id=self.st.get_node_id(), line=self.current().line)
-        node.name = self.consume().value
-        self.consume('(')
-        node.params = self.parse_maxthree()
-        self.consume(')')
-        self.consume('{')
-        node.local_vars, node.body = self.parse_body()
-        self.consume('}')
-        return node
+        node_id = self.get_node_id()
+        line = self.lines[self.pos]
+        name = self.consume()
+        self.consume_lparen()
+        params = self.parse_maxthree()
+        self.consume_rparen()
+        self.consume_lbrace()
+        local_vars, body = self.parse_body()
+        self.consume_rbrace()
+        return ProcDefNode(node_id=node_id, line=line, name=name, params=params,
+                           local_vars=local_vars, body=body)
         
     def parse_funcdefs(self) -> List[FuncDefNode]:
-        funcs = []
-        while self.match_type('ID'):
+        funcs: List[FuncDefNode] = []
+        types = self.types
+        while types[self.pos] is TOK_ID:
             funcs.append(self.parse_fdef())
         return funcs
         
     def parse_fdef(self) -> FuncDefNode:
-        node = FuncDefNode(node_id=self.st.get_node_id(), line=self.current().line)
-        node.name = self.consume().value
-        self.consume('(')
-        node.params = self.parse_maxthree()
-        self.consume(')')
-        self.consume('{')
-        node.local_vars, node.body = self.parse_body()
+        node_id = self.get_node_id()
+        line = self.lines[self.pos]
+        name = self.consume()
+        self.consume_lparen()
+        params = self.parse_maxthree()
+        self.consume_rparen()
+        self.consume_lbrace()
+        local_vars, body = self.parse_body()
         
         # Handle optional semicolon before return
-        if self.match(';'):
-            self.consume(';')
-        
-        self.consume('return')
-        node.return_atom = self.parse_atom()
-        self.consume('}')
-        return node
-        
-    def parse_body(self):
-        self.consume('local')
-        self.consume('{')
+        if self.match(SYM_SEMI):
+            self.consume(SYM_SEMI)
+        
+        self.consume(KW_RETURN)
+        return_atom = self.parse_atom()
+        self.consume_rbrace()
+        return FuncDefNode(node_id=node_id, line=line, name=name, params=params,
+                           local_vars=local_vars, body=body, return_atom=return_atom)
+        
+    def parse_body(self) -> Tuple[List[str], AlgoNode]:
+        self.consume(KW_LOCAL)
+        self.consume_lbrace()
         local_vars = self.parse_maxthree()
-        self.consume('}')
+        self.consume_rbrace()
         algo = self.parse_algo()
         return local_vars, algo
         
     def parse_maxthree(self) -> List[str]:
-        vars = []
-        for _ in range(3):
-            if self.match_type('ID') and not self.match('{'):
-                vars.append(self.consume().value)
-            else:
-                break
-        return vars
+        # like parse_variables, but at most three IDs
+        start = end = self.pos
+        values, types = self.values, self.types
+        while end - start < 3 and types[end] is TOK_ID and values[end] is not SYM_LBRACE:
+            end += 1
+        self.pos = end
+        return values[start:end]
         
     def parse_mainprog(self) -> MainProgNode:
-        node = MainProgNode(node_id=self.st.get_node_id(), line=self.current().line)
-        self.consume('var')
-        self.consume('{')
-        node.variables = self.parse_variables()
-        self.consume('}')
-        node.body = self.parse_algo()
-        return node
+        node_id = self.get_node_id()
+        line = self.lines[self.pos]
+        self.consume(KW_VAR)
+        self.consume_lbrace()
+        variables = self.parse_variables()
+        self.consume_rbrace()
+        body = self.parse_algo()
+        return MainProgNode(node_id=node_id, line=line, variables=variables, body=body)
         
     def parse_algo(self) -> AlgoNode:
-        node = AlgoNode(node_id=self.st.get_node_id(), line=self.current().line)
+        values = self.values
         
         # Check if we have any instructions (algorithm might be empty)
-        if not self.match('}') and not self.match('return') and not self.match('until'):
-            node.instructions.append(self.parse_instr())
-            
-            while self.match(';'):
-                self.consume(';')
-                if not self.match('}') and not self.match('until') and not self.match('return'):
-                    node.instructions.append(self.parse_instr())
-                else:
-                    break
-        return node
+        v = values[self.pos]
+        if v is SYM_RBRACE or v is KW_RETURN or v is KW_UNTIL:
+            # the id is still drawn, so later nodes keep their numbers
+            self.get_node_id()
+            return EMPTY_ALGO
+        
+        node_id = self.get_node_id()
+        line = self.lines[self.pos]
+        instructions: List[InstrNode] = []
+        # INSTR (';' INSTR)*, where a ';' may also close the sequence
+        while True:
+            instructions.append(self.parse_instr())
+            if values[self.pos] is not SYM_SEMI:
+                break
+            self.pos += 1
+            v = values[self.pos]
+            if v is SYM_RBRACE or v is KW_UNTIL or v is KW_RETURN:
+                break
+        return AlgoNode(node_id=node_id, line=line, instructions=instructions)
         
     def parse_instr(self) -> InstrNode:
-        if self.match('halt'):
-            self.consume('halt')
-            return HaltNode(node_id=self.st.get_node_id(), line=self.current().line)
-            
-        if self.match('print'):
-            self.consume('print')
-            node = PrintNode(node_id=self.st.get_node_id(), line=self.current().line)
-            if self.match_type('STRING'):
-                node.output = self.consume().value
-                node.is_string = True
-            else:
-                node.output = self.parse_atom()
-                node.is_string = False
-            return node
-            
-        if self.match('if'):
-            return self.parse_branch()
-            
-        if self.match('while') or self.match('do'):
-            return self.parse_loop()
+        # instructions that start with a keyword are picked by table lookup
+        parse_keyword_instr = self._INSTR_DISPATCH.get(self.values[self.pos])
+        if parse_keyword_instr is not None:
+            return parse_keyword_instr(self)
             
         # Assignment or procedure call
-        if self.match_type('ID'):
-            var_name = self.consume().value
+        if self.types[self.pos] is TOK_ID:
+            var_name = self.consume()
             
-            if self.match('='):
-                self.consume('=')
-                node = AssignNode(node_id=self.st.get_node_id(), line=self.current().line)
-                node.var = var_name
+            if self.match(SYM_ASSIGN):
+                self.consume(SYM_ASSIGN)
+                node_id = self.get_node_id()
+                line = self.lines[self.pos]
                 
-                # Check for function call
-                if self.match_type('ID'):
-                    checkpoint = self.pos
-                    func_name = self.consume().value
-                    if self.match('('):
-                        self.consume('(')
-                        args = self.parse_input()
-                        self.consume(')')
-                        call = CallNode()
-                        call.name = func_name
-                        call.args = args
-                        node.expr = call
-                        node.is_func_call = True
-                    else:
-                        self.pos = checkpoint
-                        node.expr = self.parse_term()
-                else:
-                    node.expr = self.parse_term()
-                return node
+                # Function call: an ID followed by '('
+                if self.match_type(TOK_ID) and self.peek_value(1) is SYM_LPAREN:
+                    func_name = self.consume()
+                    self.consume_lparen()
+                    args = self.parse_input()
+                    self.consume_rparen()
+                    return AssignNode(node_id=node_id, line=line, var=var_name,
+                                      expr=CallNode(name=func_name, args=args), is_func_call=True)
+                return AssignNode(node_id=node_id, line=line, var=var_name, expr=self.parse_term())
                 
-            elif self.match('('):
+            elif self.match(SYM_LPAREN):
                 # Procedure call
-                self.consume('(')
-                node = CallNode(node_id=self.st.get_node_id(), line=self.current().line)
-                node.name = var_name
-                node.args = self.parse_input()
-                self.consume(')')
-                return node
+                self.consume_lparen()
+                node_id = self.get_node_id()
+                line = self.lines[self.pos]
+                args = self.parse_input()
+                self.consume_rparen()
+                return CallNode(node_id=node_id, line=line, name=var_name, args=args)
                 
         self.error(f"Unexpected token in instruction: {self.current()}")
         
+    def parse_halt(self) -> HaltNode:
+        self.pos += 1
+        return HaltNode(node_id=self.get_node_id(), line=self.lines[self.pos])
+        
+    def parse_print(self) -> PrintNode:
+        self.pos += 1
+        node_id = self.get_node_id()
+        line = self.lines[self.pos]
+        if self.types[self.pos] is TOK_STRING:
+            return PrintNode(node_id=node_id, line=line, output=self.consume(),
+                             is_string=True, kind=PRINT_STRING)
+        output = self.parse_atom()
+        return PrintNode(node_id=node_id, line=line, output=output, is_string=False,
+                         kind=PRINT_VAR if output.is_var else PRINT_NUM)
+        
     def parse_branch(self) -> BranchNode:
-        node = BranchNode(node_id=self.st.get_node_id(), line=self.current().line)
-        self.consume('if')
-        node.condition = self.parse_term()
-        self.consume('{')
-        node.then_branch = self.parse_algo()
-        self.consume('}')
-        
-        if self.match('else'):
-            self.consume('else')
-            self.consume('{')
-            node.else_branch = self.parse_algo()
-            self.consume('}')
+        node_id = self.get_node_id()
+        line = self.lines[self.pos]
+        self.consume(KW_IF)
+        condition = self.parse_term()
+        self.consume_lbrace()
+        then_branch = self.parse_algo()
+        self.consume_rbrace()
+        
+        else_branch = None
+        if self.match(KW_ELSE):
+            self.consume(KW_ELSE)
+            self.consume_lbrace()
+            else_branch = self.parse_algo()
+            self.consume_rbrace()
             
-        return node
+        return BranchNode(node_id=node_id, line=line, condition=condition,
+                          then_branch=then_branch, else_branch=else_branch)
         
     def parse_loop(self) -> LoopNode:
-        node = LoopNode(node_id=self.st.get_node_id(), line=self.current().line)
-        
-        if self.match('while'):
-            self.consume('while')
-            node.is_while = True
-            node.condition = self.parse_term()
-            self.consume('{')
-            node.body = self.parse_algo()
-            self.consume('}')
-        else:
-            self.consume('do')
-            node.is_while = False
-            self.consume('{')
-            node.body = self.parse_algo()
-            self.consume('}')
-            self.consume('until')
-            node.condition = self.parse_term()
-            
-        return node
+        node_id = self.get_node_id()
+        line = self.lines[self.pos]
+        
+        if self.match(KW_WHILE):
+            self.consume(KW_WHILE)
+            condition = self.parse_term()
+            self.consume_lbrace()
+            body = self.parse_algo()
+            self.consume_rbrace()
+            return LoopNode(node_id=node_id, line=line, condition=condition, body=body, is_while=True)
+        
+        self.consume(KW_DO)
+        self.consume_lbrace()
+        body = self.parse_algo()
+        self.consume_rbrace()
+        self.consume(KW_UNTIL)
+        condition = self.parse_term()
+        return LoopNode(node_id=node_id, line=line, condition=condition, body=body, is_while=False)
         
     def parse_input(self) -> List[AtomNode]:
-        args = []
+        args: List[AtomNode] = []
+        values, types, lines = self.values, self.types, self.lines
+        get_node_id = self.get_node_id
         for _ in range(3):
-            if not self.match(')'):
-                args.append(self.parse_atom())
-            else:
+            pos = self.pos
+            value = values[pos]
+            if value is SYM_RPAREN:
                 break
+            # parse_atom, inlined
+            node_id = get_node_id()
+            tok_type = types[pos]
+            if tok_type is TOK_NUMBER:
+                args.append(AtomNode(node_id=node_id, line=lines[pos], value=int(value), is_var=False))
+            elif tok_type is TOK_ID:
+                args.append(AtomNode(node_id=node_id, line=lines[pos], value=value, is_var=True))
+            else:
+                self.error(f"Expected atom, got {self.current()}")
+            self.pos = pos + 1
         return args
         
     def parse_atom(self) -> AtomNode:
-        node = AtomNode(node_id=self.st.get_node_id(), line=self.current().line)
-        tok = self.current()
-        
-        if tok.type == 'NUMBER':
-            node.value = int(self.consume().value)
-            node.is_var = False
-        elif tok.type == 'ID':
-            node.value = self.consume().value
-            node.is_var = True
-        else:
-            self.error(f"Expected atom, got {tok}")
-            
-        return node
+        node_id = self.get_node_id()
+        line = self.lines[self.pos]
+        tok_type = self.types[self.pos]
+        
+        if tok_type is TOK_NUMBER:
+            return AtomNode(node_id=node_id, line=line, value=int(self.consume()), is_var=False)
+        if tok_type is TOK_ID:
+            return AtomNode(node_id=node_id, line=line, value=self.consume(), is_var=True)
+        self.error(f"Expected atom, got {self.current()}")
         
     def parse_term(self) -> TermNode:
-        if self.match('('):
-            self.consume('(')
-            
-            if self.match('neg') or self.match('not'):
-                node = UnopTermNode(node_id=self.st.get_node_id(), line=self.current().line)
-                node.op = self.consume().value
-                node.term = self.parse_term()
-                self.consume(')')
-                return node
-            
-            if self.current().value in ['eq', '>', 'or', 'and', 'plus', 'minus', 'mult', 'div']:
-                node = BinopTermNode(node_id=self.st.get_node_id(), line=self.current().line)
-                node.op = self.consume().value
-                node.left = self.parse_term()
-                node.right = self.parse_term()
-                self.consume(')')
-                return node
-            
-            left_term = self.parse_term()
-            if self.current().value in ['eq', '>', 'or', 'and', 'plus', 'minus', 'mult', 'div']:
-                node = BinopTermNode(node_id=self.st.get_node_id(), line=self.current().line)
-                node.left = left_term
-                node.op = self.consume().value
-                node.right = self.parse_term()
-                self.consume(')')
-                return node
+        # Iterative: each '(' pushes a frame waiting for its operand terms,
+        # and each finished term is handed to the frames on top of the stack
+        # until one still needs another operand. Node ids are taken in the
+        # same order as a recursive descent would, and deep nesting cannot
+        # hit the recursion limit.
+        values, types, lines = self.values, self.types, self.lines
+        get_node_id = self.get_node_id
+        stack: List[list] = []  # [frame kind, node_id, line, op, left]
+        while True:
+            if values[self.pos] is SYM_LPAREN:
+                self.pos += 1
+                op = values[self.pos]
+                if op in _UNOPS:
+                    stack.append([_TERM_UNOP, get_node_id(), lines[self.pos], op, None])
+                    self.pos += 1
+                elif op in _BINOPS:
+                    stack.append([_TERM_PREFIX, get_node_id(), lines[self.pos], op, None])
+                    self.pos += 1
+                else:
+                    stack.append([_TERM_INFIX, 0, 0, None, None])
+                continue
             
-            self.consume(')')
-            return left_term
+            # an ATOM term, with parse_atom inlined
+            pos = self.pos
+            term_id = get_node_id()
+            atom_id = get_node_id()
+            value = values[pos]
+            tok_type = types[pos]
+            if tok_type is TOK_NUMBER:
+                atom = AtomNode(node_id=atom_id, line=lines[pos], value=int(value), is_var=False)
+            elif tok_type is TOK_ID:
+                atom = AtomNode(node_id=atom_id, line=lines[pos], value=value, is_var=True)
+            else:
+                self.error(f"Expected atom, got {self.current()}")
+            self.pos = pos + 1
+            term = AtomTermNode(node_id=term_id, line=lines[pos], atom=atom)
             
-        node = AtomTermNode(node_id=self.st.get_node_id(), line=self.current().line)
-        node.atom = self.parse_atom()
-        return node
+            while stack:
+                frame = stack[-1]
+                kind = frame[0]
+                if kind == _TERM_PREFIX and frame[4] is None:
+                    # first of two operands; parse the second
+                    frame[4] = term
+                    break
+                if kind == _TERM_INFIX:
+                    op = values[self.pos]
+                    if op in _BINOPS:
+                        # left operand done; the operator follows it
+                        frame[:] = [_TERM_RIGHT, get_node_id(), lines[self.pos], op, term]
+                        self.pos += 1
+                        break
+                    # a parenthesised term on its own
+                    stack.pop()
+                    self.consume_rparen()
+                    continue
+                stack.pop()
+                self.consume_rparen()
+                if kind == _TERM_UNOP:
+                    term = UnopTermNode(node_id=frame[1], line=frame[2], op=frame[3], term=term)
+                else:
+                    term = BinopTermNode(node_id=frame[1], line=frame[2], op=frame[3],
+                                         left=frame[4], right=term)
+            else:
+                return term
+
+# Parser for each keyword that opens an instruction
+Parser._INSTR_DISPATCH = {
+    KW_HALT: Parser.parse_halt,
+    KW_PRINT: Parser.parse_print,
+    KW_IF: Parser.parse_branch,
+    KW_WHILE: Parser.parse_loop,
+    KW_DO: Parser.parse_loop,
+}
 
 # ============================================================================
 # SCOPE ANALYZER - NAME-SCOPE-RULES COMPLIANT
 # ============================================================================
 
+# Enum members bound at module level; the scope analyzer reads these on
+# every SymbolInfo it builds, and a global lookup beats a class attribute.
+_GLOBAL = ScopeType.GLOBAL
+_LOCAL = ScopeType.LOCAL
+_MAIN = ScopeType.MAIN
+_TYPELESS = VarType.TYPELESS
+_NO_NAMES: AbstractSet[str] = frozenset()
+
+def _find_dups(names: List[str]) -> Tuple[Dict[str, None], List[str]]:
+    """
+    Split names into the distinct ones, in first-seen order (a dict used as
+    an ordered set), and the repeats, in the order they occur.
+    """
+    seen: Dict[str, None] = {}
+    dups: List[str] = []
+    for name in names:
+        if name in seen:
+            dups.append(name)
+        else:
+            seen[name] = None
+    return seen, dups
+
+@dataclass
+class ScopeContext:
+    """Names visible while walking one procedure, function or main body."""
+    scope: ScopeType
+    params: AbstractSet[str] = _NO_NAMES
+    local_vars: AbstractSet[str] = _NO_NAMES
+    main_vars: AbstractSet[str] = _NO_NAMES
+    procedure_name: Optional[str] = None
+    function_name: Optional[str] = None
+
 class ScopeAnalyzer:
+    # Stop running further phases once this many errors have been collected
+    MAX_ERRORS = 100
+    
     def __init__(self, ast: ProgramNode, symbol_table: SymbolTable):
         self.ast = ast
         self.st = symbol_table
         self.global_variables: Set[str] = set()
         self.procedure_names: Set[str] = set()
         self.function_names: Set[str] = set()
+        # Scope visitor for each instruction and term KIND; halt has none
+        self._instr_handlers: Dict[int, Callable[[Any, ScopeContext], None]] = {
+            KIND_ASSIGN: self.analyze_assign_variables,
+            KIND_CALL: self.analyze_call_variables,
+            KIND_PRINT: self.analyze_print_variables,
+            KIND_BRANCH: self.analyze_branch_variables,
+            KIND_LOOP: self.analyze_loop_variables,
+        }
+        self._term_handlers: Dict[int, Callable[[Any, ScopeContext], None]] = {
+            KIND_ATOM_TERM: self.analyze_atom_term_variables,
+            KIND_UNOP_TERM: self.analyze_unop_term_variables,
+            KIND_BINOP_TERM: self.analyze_binop_term_variables,
+        }
         
     def analyze(self):
         if not self.ast:
             return
+        # Errors already present come from parsing; the AST is incomplete
+        if self.st.has_errors():
+            return
         print("Starting NAME-SCOPE-RULES analysis...")
-        self.collect_everywhere_scope_names()
-        self.check_everywhere_scope_conflicts()
-        self.analyze_global_scope()
-        self.analyze_procedure_scope()
-        self.analyze_function_scope()
-        self.analyze_main_scope()
+        for phase in (self.collect_everywhere_scope_names,
+                      self.check_everywhere_scope_conflicts,
+                      self.analyze_global_scope,
+                      self.analyze_procedure_scope,
+                      self.analyze_function_scope,
+                      self.analyze_main_scope):
+            phase()
+            if len(self.st.errors) > self.MAX_ERRORS:
+                print("NAME-SCOPE-RULES analysis aborted: too many errors.")
+                return
         print("NAME-SCOPE-RULES analysis completed.")
     
     def collect_everywhere_scope_names(self):
-        for var in self.ast.variables:
-            if var in self.global_variables:
-                self.emit_name_rule_violation(f"double-declaration: Duplicate global variable declaration: '{var}'")
-            else:
-                self.global_variables.add(var)
-                self.st.global_vars.add(var)
-                symbol = SymbolInfo(
-                    name=var,
-                    node_id=self.st.get_node_id(),
-                    scope=ScopeType.GLOBAL,
-                    var_type=VarType.TYPELESS,
-                    is_global=True
-                )
-                self.st.add_symbol(symbol)
+        seen, dups = _find_dups(self.ast.variables)
+        for var in dups:
+            self.emit_name_rule_violation(f"double-declaration: Duplicate global variable declaration: '{var}'")
+        self.global_variables.update(seen)
+        new_globals = list(seen)
+        self.st.global_vars.update(new_globals)
+        node_ids = self.st.reserve_node_ids(len(new_globals))
+        self.st.add_symbols_bulk([
+            SymbolInfo(
+                name=var,
+                node_id=node_id,
+                scope=_GLOBAL,
+                var_type=_TYPELESS,
+                is_global=True
+            )
+            for var, node_id in zip(new_globals, node_ids)
+        ])
         
         for proc in self.ast.procedures:
             if proc.name in self.procedure_names:
@@ -910,40 +1289,40 @@ class ScopeAnalyzer:
     def analyze_main_scope(self):
         if not self.ast.main:
             return
-        main_vars = set()
-        for var in self.ast.main.variables:
-            if var in main_vars:
-                self.emit_name_rule_violation(f"double-declaration: Duplicate variable declaration in main: '{var}'")
-            else:
-                main_vars.add(var)
-                symbol = SymbolInfo(
-                    name=var,
-                    node_id=self.st.get_node_id(),
-                    scope=ScopeType.MAIN,
-                    var_type=VarType.TYPELESS,
-                    is_main_var=True
-                )
-                self.st.add_symbol(symbol)
+        get_id = self.st.get_node_id
+        add = self.st.add_symbol
+        main_vars, dups = _find_dups(self.ast.main.variables)
+        for var in dups:
+            self.emit_name_rule_violation(f"double-declaration: Duplicate variable declaration in main: '{var}'")
+        for var in main_vars:
+            symbol = SymbolInfo(
+                name=var,
+                node_id=get_id(),
+                scope=_MAIN,
+                var_type=_TYPELESS,
+                is_main_var=True
+            )
+            add(symbol)
         if self.ast.main.body:
-            self.analyze_algo_variables(self.ast.main.body, ScopeType.MAIN, 
-                                      params=[], local_vars=[], main_vars=list(main_vars))
+            self.analyze_algo_variables(self.ast.main.body,
+                                        ScopeContext(_MAIN, main_vars=main_vars))
     
     def analyze_procedure_local_scope(self, proc: ProcDefNode):
-        param_set = set()
-        for param in proc.params:
-            if param in param_set:
-                self.emit_name_rule_violation(f"double-declaration: Duplicate parameter in procedure '{proc.name}': '{param}'")
-            else:
-                param_set.add(param)
-                symbol = SymbolInfo(
-                    name=param,
-                    node_id=self.st.get_node_id(),
-                    scope=ScopeType.LOCAL,
-                    var_type=VarType.TYPELESS,
-                    is_parameter=True,
-                    procedure_name=proc.name
-                )
-                self.st.add_symbol(symbol)
+        get_id = self.st.get_node_id
+        add = self.st.add_symbol
+        param_set, dups = _find_dups(proc.params)
+        for param in dups:
+            self.emit_name_rule_violation(f"double-declaration: Duplicate parameter in procedure '{proc.name}': '{param}'")
+        for param in param_set:
+            symbol = SymbolInfo(
+                name=param,
+                node_id=get_id(),
+                scope=_LOCAL,
+                var_type=_TYPELESS,
+                is_parameter=True,
+                procedure_name=proc.name
+            )
+            add(symbol)
         
         local_set = set()
         for local_var in proc.local_vars:
@@ -955,35 +1334,34 @@ class ScopeAnalyzer:
                 local_set.add(local_var)
                 symbol = SymbolInfo(
                     name=local_var,
-                    node_id=self.st.get_node_id(),
-                    scope=ScopeType.LOCAL,
-                    var_type=VarType.TYPELESS,
+                    node_id=get_id(),
+                    scope=_LOCAL,
+                    var_type=_TYPELESS,
                     is_local=True,
                     procedure_name=proc.name
                 )
-                self.st.add_symbol(symbol)
+                add(symbol)
         
         if proc.body:
-            self.analyze_algo_variables(proc.body, ScopeType.LOCAL, 
-                                      params=list(param_set), local_vars=list(local_set), 
-                                      procedure_name=proc.name)
+            self.analyze_algo_variables(proc.body, ScopeContext(
+                _LOCAL, param_set, local_set, procedure_name=proc.name))
     
     def analyze_function_local_scope(self, func: FuncDefNode):
-        param_set = set()
-        for param in func.params:
-            if param in param_set:
-                self.emit_name_rule_violation(f"double-declaration: Duplicate parameter in function '{func.name}': '{param}'")
-            else:
-                param_set.add(param)
-                symbol = SymbolInfo(
-                    name=param,
-                    node_id=self.st.get_node_id(),
-                    scope=ScopeType.LOCAL,
-                    var_type=VarType.TYPELESS,
-                    is_parameter=True,
-                    function_name=func.name
-                )
-                self.st.add_symbol(symbol)
+        get_id = self.st.get_node_id
+        add = self.st.add_symbol
+        param_set, dups = _find_dups(func.params)
+        for param in dups:
+            self.emit_name_rule_violation(f"double-declaration: Duplicate parameter in function '{func.name}': '{param}'")
+        for param in param_set:
+            symbol = SymbolInfo(
+                name=param,
+                node_id=get_id(),
+                scope=_LOCAL,
+                var_type=_TYPELESS,
+                is_parameter=True,
+                function_name=func.name
+            )
+            add(symbol)
         
         local_set = set()
         for local_var in func.local_vars:
@@ -995,143 +1373,123 @@ class ScopeAnalyzer:
                 local_set.add(local_var)
                 symbol = SymbolInfo(
                     name=local_var,
-                    node_id=self.st.get_node_id(),
-                    scope=ScopeType.LOCAL,
-                    var_type=VarType.TYPELESS,
+                    node_id=get_id(),
+                    scope=_LOCAL,
+                    var_type=_TYPELESS,
                     is_local=True,
                     function_name=func.name
                 )
-                self.st.add_symbol(symbol)
+                add(symbol)
         
+        ctx = ScopeContext(_LOCAL, param_set, local_set, function_name=func.name)
         if func.body:
-            self.analyze_algo_variables(func.body, ScopeType.LOCAL, 
-                                      params=list(param_set), local_vars=list(local_set), 
-                                      function_name=func.name)
+            self.analyze_algo_variables(func.body, ctx)
         
         if func.return_atom and func.return_atom.is_var:
-            self.check_variable_declaration(func.return_atom.value, ScopeType.LOCAL, 
-                                          params=list(param_set), local_vars=list(local_set),
-                                          main_vars=[], function_name=func.name)
-    
-    def analyze_algo_variables(self, algo: AlgoNode, current_scope: ScopeType, 
-                             params: List[str] = None, local_vars: List[str] = None,
-                             main_vars: List[str] = None, procedure_name: str = None,
-                             function_name: str = None):
-        params = params or []
-        local_vars = local_vars or []
-        main_vars = main_vars or []
-        
-        for instr in algo.instructions:
-            self.analyze_instruction_variables(instr, current_scope, params, local_vars, 
-                                             main_vars, procedure_name, function_name)
-    
-    def analyze_instruction_variables(self, instr: InstrNode, current_scope: ScopeType,
-                                    params: List[str], local_vars: List[str], 
-                                    main_vars: List[str], procedure_name: str = None,
-                                    function_name: str = None):
-        if isinstance(instr, AssignNode):
-            self.check_variable_declaration(instr.var, current_scope, params, local_vars, 
-                                          main_vars, procedure_name, function_name)
-            if isinstance(instr.expr, TermNode):
-                self.analyze_term_variables(instr.expr, current_scope, params, local_vars,
-                                          main_vars, procedure_name, function_name)
-            elif instr.is_func_call and isinstance(instr.expr, CallNode):
-                self.analyze_call_variables(instr.expr, current_scope, params, local_vars,
-                                          main_vars, procedure_name, function_name)
-        elif isinstance(instr, CallNode):
-            self.analyze_call_variables(instr, current_scope, params, local_vars,
-                                      main_vars, procedure_name, function_name)
-        elif isinstance(instr, PrintNode):
-            if not instr.is_string and isinstance(instr.output, AtomNode) and instr.output.is_var:
-                self.check_variable_declaration(instr.output.value, current_scope, params, 
-                                              local_vars, main_vars, procedure_name, function_name)
-        elif isinstance(instr, BranchNode):
-            if instr.condition:
-                self.analyze_term_variables(instr.condition, current_scope, params, local_vars,
-                                          main_vars, procedure_name, function_name)
-            if instr.then_branch:
-                self.analyze_algo_variables(instr.then_branch, current_scope, params, local_vars,
-                                          main_vars, procedure_name, function_name)
-            if instr.else_branch:
-                self.analyze_algo_variables(instr.else_branch, current_scope, params, local_vars,
-                                          main_vars, procedure_name, function_name)
-        elif isinstance(instr, LoopNode):
-            if instr.condition:
-                self.analyze_term_variables(instr.condition, current_scope, params, local_vars,
-                                          main_vars, procedure_name, function_name)
-            if instr.body:
-                self.analyze_algo_variables(instr.body, current_scope, params, local_vars,
-                                          main_vars, procedure_name, function_name)
+            self.check_variable_declaration(func.return_atom.value, ctx)
     
-    def analyze_call_variables(self, call: CallNode, current_scope: ScopeType,
-                             params: List[str], local_vars: List[str], main_vars: List[str],
-                             procedure_name: str = None, function_name: str = None):
+    def analyze_algo_variables(self, algo: AlgoNode, ctx: ScopeContext):
+        for instr in algo.instructions:
+            self.analyze_instruction_variables(instr, ctx)
+    
+    def analyze_instruction_variables(self, instr: InstrNode, ctx: ScopeContext):
+        visit = self._instr_handlers.get(instr.KIND)
+        if visit:
+            visit(instr, ctx)
+    
+    def analyze_assign_variables(self, instr: AssignNode, ctx: ScopeContext):
+        self.check_variable_declaration(instr.var, ctx)
+        expr_kind = node_kind(instr.expr)
+        if expr_kind in self._term_handlers:
+            self.analyze_term_variables(instr.expr, ctx)
+        elif instr.is_func_call and expr_kind == KIND_CALL:
+            self.analyze_call_variables(instr.expr, ctx)
+    
+    def analyze_print_variables(self, instr: PrintNode, ctx: ScopeContext):
+        if not instr.is_string and isinstance(instr.output, AtomNode) and instr.output.is_var:
+            self.check_variable_declaration(instr.output.value, ctx)
+    
+    def analyze_branch_variables(self, instr: BranchNode, ctx: ScopeContext):
+        if instr.condition:
+            self.analyze_term_variables(instr.condition, ctx)
+        if instr.then_branch:
+            self.analyze_algo_variables(instr.then_branch, ctx)
+        if instr.else_branch:
+            self.analyze_algo_variables(instr.else_branch, ctx)
+    
+    def analyze_loop_variables(self, instr: LoopNode, ctx: ScopeContext):
+        if instr.condition:
+            self.analyze_term_variables(instr.condition, ctx)
+        if instr.body:
+            self.analyze_algo_variables(instr.body, ctx)
+    
+    def analyze_call_variables(self, call: CallNode, ctx: ScopeContext):
         if call.name not in self.procedure_names and call.name not in self.function_names:
             self.st.add_error(f"undeclared: Undeclared procedure or function: '{call.name}'")
         for arg in call.args:
             if arg.is_var:
-                self.check_variable_declaration(arg.value, current_scope, params, local_vars,
-                                              main_vars, procedure_name, function_name)
-    
-    def analyze_term_variables(self, term: TermNode, current_scope: ScopeType,
-                             params: List[str], local_vars: List[str], main_vars: List[str],
-                             procedure_name: str = None, function_name: str = None):
-        if isinstance(term, AtomTermNode):
-            if term.atom and term.atom.is_var:
-                self.check_variable_declaration(term.atom.value, current_scope, params, 
-                                              local_vars, main_vars, procedure_name, function_name)
-        elif isinstance(term, UnopTermNode):
-            if term.term:
-                self.analyze_term_variables(term.term, current_scope, params, local_vars,
-                                          main_vars, procedure_name, function_name)
-        elif isinstance(term, BinopTermNode):
-            if term.left:
-                self.analyze_term_variables(term.left, current_scope, params, local_vars,
-                                          main_vars, procedure_name, function_name)
-            if term.right:
-                self.analyze_term_variables(term.right, current_scope, params, local_vars,
-                                          main_vars, procedure_name, function_name)
-    
-    def check_variable_declaration(self, var_name: str, current_scope: ScopeType,
-                                 params: List[str], local_vars: List[str], main_vars: List[str],
-                                 procedure_name: str = None, function_name: str = None):
-        if current_scope == ScopeType.LOCAL:
+                self.check_variable_declaration(arg.value, ctx)
+    
+    def analyze_term_variables(self, term: TermNode, ctx: ScopeContext):
+        visit = self._term_handlers.get(term.KIND)
+        if visit:
+            visit(term, ctx)
+    
+    def analyze_atom_term_variables(self, term: AtomTermNode, ctx: ScopeContext):
+        if term.atom and term.atom.is_var:
+            self.check_variable_declaration(term.atom.value, ctx)
+    
+    def analyze_unop_term_variables(self, term: UnopTermNode, ctx: ScopeContext):
+        if term.term:
+            self.analyze_term_variables(term.term, ctx)
+    
+    def analyze_binop_term_variables(self, term: BinopTermNode, ctx: ScopeContext):
+        if term.left:
+            self.analyze_term_variables(term.left, ctx)
+        if term.right:
+            self.analyze_term_variables(term.right, ctx)
+    
+    def check_variable_declaration(self, var_name: str, ctx: ScopeContext):
+        current_scope = ctx.scope
+        if current_scope == _LOCAL:
+            procedure_name = ctx.procedure_name
+            function_name = ctx.function_name
             if procedure_name:
-                if var_name in params:
-                    self.update_symbol_table_for_var(var_name, ScopeType.LOCAL, is_parameter=True,
+                if var_name in ctx.params:
+                    self.update_symbol_table_for_var(var_name, _LOCAL, is_parameter=True,
                                                    procedure_name=procedure_name)
                     return
-                elif var_name in local_vars:
-                    self.update_symbol_table_for_var(var_name, ScopeType.LOCAL, is_local=True,
+                elif var_name in ctx.local_vars:
+                    self.update_symbol_table_for_var(var_name, _LOCAL, is_local=True,
                                                    procedure_name=procedure_name)
                     return
                 elif var_name in self.global_variables:
-                    self.update_symbol_table_for_var(var_name, ScopeType.GLOBAL, is_global=True)
+                    self.update_symbol_table_for_var(var_name, _GLOBAL, is_global=True)
                     return
                 else:
                     self.emit_undeclared_variable(var_name, f"procedure '{procedure_name}'")
                     
             elif function_name:
-                if var_name in params:
-                    self.update_symbol_table_for_var(var_name, ScopeType.LOCAL, is_parameter=True,
+                if var_name in ctx.params:
+                    self.update_symbol_table_for_var(var_name, _LOCAL, is_parameter=True,
                                                    function_name=function_name)
                     return
-                elif var_name in local_vars:
-                    self.update_symbol_table_for_var(var_name, ScopeType.LOCAL, is_local=True,
+                elif var_name in ctx.local_vars:
+                    self.update_symbol_table_for_var(var_name, _LOCAL, is_local=True,
                                                    function_name=function_name)
                     return
                 elif var_name in self.global_variables:
-                    self.update_symbol_table_for_var(var_name, ScopeType.GLOBAL, is_global=True)
+                    self.update_symbol_table_for_var(var_name, _GLOBAL, is_global=True)
                     return
                 else:
                     self.emit_undeclared_variable(var_name, f"function '{function_name}'")
                     
-        elif current_scope == ScopeType.MAIN:
-            if var_name in main_vars:
-                self.update_symbol_table_for_var(var_name, ScopeType.MAIN, is_main_var=True)
+        elif current_scope == _MAIN:
+            if var_name in ctx.main_vars:
+                self.update_symbol_table_for_var(var_name, _MAIN, is_main_var=True)
                 return
             elif var_name in self.global_variables:
-                self.update_symbol_table_for_var(var_name, ScopeType.GLOBAL, is_global=True)
+                self.update_symbol_table_for_var(var_name, _GLOBAL, is_global=True)
                 return
             else:
                 self.emit_undeclared_variable(var_name, "main")
@@ -1144,7 +1502,7 @@ class ScopeAnalyzer:
             name=var_name,
             node_id=self.st.get_node_id(),
             scope=scope,
-            var_type=VarType.TYPELESS,
+            var_type=_TYPELESS,
             is_parameter=is_parameter,
             is_local=is_local,
             is_global=is_global,
@@ -1161,257 +1519,285 @@ class ScopeAnalyzer:
         self.st.add_error(f"undeclared: UNDECLARED-VARIABLE: '{var_name}' in {context}")
     
     def print_symbol_table_report(self):
-        print("\n=== SYMBOL TABLE REPORT ===")
-        print(f"Global Variables: {self.global_variables}")
-        print(f"Procedure Names: {self.procedure_names}")
-        print(f"Function Names: {self.function_names}")
-        print("\nSymbol Table Entries:")
-        for node_id, symbol in self.st.symbols.items():
-            print(f"  Node {node_id}: {symbol.name} [{symbol.scope.value}] "
-                  f"{'(param)' if symbol.is_parameter else ''}"
-                  f"{'(local)' if symbol.is_local else ''}"
-                  f"{'(global)' if symbol.is_global else ''}"
-                  f"{'(main)' if symbol.is_main_var else ''}"
-                  f"{' in ' + symbol.procedure_name if symbol.procedure_name else ''}"
-                  f"{' in ' + symbol.function_name if symbol.function_name else ''}")
-        print("=== END SYMBOL TABLE REPORT ===\n")
-        
-    def analyze_procedure(self, proc: ProcDefNode):
-        if len(proc.params) != len(set(proc.params)):
-            self.st.add_error(f"Duplicate parameters in procedure {proc.name}")
-        if len(proc.local_vars) != len(set(proc.local_vars)):
-            self.st.add_error(f"Duplicate local variables in procedure {proc.name}")
-        param_set = set(proc.params)
-        for local_var in proc.local_vars:
-            if local_var in param_set:
-                self.st.add_error(f"shadowing: Local variable '{local_var}' shadows parameter in procedure {proc.name}")
-        if proc.body:
-            self.analyze_algo(proc.body, proc.params, proc.local_vars, ScopeType.LOCAL)
-        
-    def analyze_function(self, func: FuncDefNode):
-        if len(func.params) != len(set(func.params)):
-            self.st.add_error(f"Duplicate parameters in function {func.name}")
-        if len(func.local_vars) != len(set(func.local_vars)):
-            self.st.add_error(f"Duplicate local variables in function {func.name}")
-        param_set = set(func.params)
-        for local_var in func.local_vars:
-            if local_var in param_set:
-                self.st.add_error(f"shadowing: Local variable '{local_var}' shadows parameter in function {func.name}")
-        if func.body:
-            self.analyze_algo(func.body, func.params, func.local_vars, ScopeType.LOCAL)
-        if func.return_atom:
-            self.check_variable_usage(func.return_atom, func.params, func.local_vars, ScopeType.LOCAL)
-    
-    def analyze_main(self, main: MainProgNode):
-        if len(main.variables) != len(set(main.variables)):
-            self.st.add_error("Duplicate variables in main program")
-        main_vars = set(main.variables)
-        conflicts = main_vars & self.st.global_vars
-        if conflicts:
-            self.st.add_warning(f"Main variables shadow global variables: {conflicts}")
-        if main.body:
-            self.analyze_algo(main.body, [], main.variables, ScopeType.MAIN)
-    
-    def analyze_algo(self, algo: AlgoNode, params: List[str], local_vars: List[str], scope: ScopeType):
-        for instr in algo.instructions:
-            self.analyze_instruction(instr, params, local_vars, scope)
-    
-    def analyze_instruction(self, instr: InstrNode, params: List[str], local_vars: List[str], scope: ScopeType):
-        if isinstance(instr, AssignNode):
-            if not self.is_variable_in_scope(instr.var, params, local_vars, scope):
-                self.st.add_error(f"Variable '{instr.var}' not in scope for assignment")
-            if instr.is_func_call and isinstance(instr.expr, CallNode):
-                self.check_function_call(instr.expr, params, local_vars, scope)
-            elif isinstance(instr.expr, TermNode):
-                self.check_term(instr.expr, params, local_vars, scope)
-        elif isinstance(instr, CallNode):
-            self.check_procedure_call(instr, params, local_vars, scope)
-        elif isinstance(instr, PrintNode):
-            if not instr.is_string and isinstance(instr.output, AtomNode):
-                self.check_variable_usage(instr.output, params, local_vars, scope)
-        elif isinstance(instr, BranchNode):
-            if instr.condition:
-                self.check_term(instr.condition, params, local_vars, scope)
-            if instr.then_branch:
-                self.analyze_algo(instr.then_branch, params, local_vars, scope)
-            if instr.else_branch:
-                self.analyze_algo(instr.else_branch, params, local_vars, scope)
-        elif isinstance(instr, LoopNode):
-            if instr.condition:
-                self.check_term(instr.condition, params, local_vars, scope)
-            if instr.body:
-                self.analyze_algo(instr.body, params, local_vars, scope)
-    
-    def check_function_call(self, call: CallNode, params: List[str], local_vars: List[str], scope: ScopeType):
-        if call.name not in self.st.functions:
-            self.st.add_error(f"Unknown function: {call.name}")
-        else:
-            func_info = self.st.functions[call.name]
-            if len(call.args) != len(func_info.params):
-                self.st.add_error(f"Function {call.name} expects {len(func_info.params)} arguments, got {len(call.args)}")
-            for arg in call.args:
-                self.check_variable_usage(arg, params, local_vars, scope)
-    
-    def check_procedure_call(self, call: CallNode, params: List[str], local_vars: List[str], scope: ScopeType):
-        if call.name not in self.st.procedures:
-            self.st.add_error(f"Unknown procedure: {call.name}")
-        else:
-            proc_info = self.st.procedures[call.name]
-            if len(call.args) != len(proc_info.params):
-                self.st.add_error(f"Procedure {call.name} expects {len(proc_info.params)} arguments, got {len(call.args)}")
-            for arg in call.args:
-                self.check_variable_usage(arg, params, local_vars, scope)
-    
-    def check_term(self, term: TermNode, params: List[str], local_vars: List[str], scope: ScopeType):
-        if isinstance(term, AtomTermNode):
-            if term.atom:
-                self.check_variable_usage(term.atom, params, local_vars, scope)
-        elif isinstance(term, UnopTermNode):
-            if term.term:
-                self.check_term(term.term, params, local_vars, scope)
-        elif isinstance(term, BinopTermNode):
-            if term.left:
-                self.check_term(term.left, params, local_vars, scope)
-            if term.right:
-                self.check_term(term.right, params, local_vars, scope)
-    
-    def check_variable_usage(self, atom: AtomNode, params: List[str], local_vars: List[str], scope: ScopeType):
-        if atom.is_var and not self.is_variable_in_scope(atom.value, params, local_vars, scope):
-            self.st.add_error(f"Variable '{atom.value}' not in scope")
-    
-    def is_variable_in_scope(self, var_name: str, params: List[str], local_vars: List[str], scope: ScopeType) -> bool:
-        if var_name in params or var_name in local_vars:
-            return True
-        if var_name in self.st.global_vars:
-            return True
-        return False
+        lines = [
+            "\n=== SYMBOL TABLE REPORT ===",
+            f"Global Variables: {self.global_variables}",
+            f"Procedure Names: {self.procedure_names}",
+            f"Function Names: {self.function_names}",
+            "\nSymbol Table Entries:",
+        ]
+        lines.extend(
+            f"  Node {node_id}: {symbol.name} [{symbol.scope.value}] "
+            f"{'(param)' if symbol.is_parameter else ''}"
+            f"{'(local)' if symbol.is_local else ''}"
+            f"{'(global)' if symbol.is_global else ''}"
+            f"{'(main)' if symbol.is_main_var else ''}"
+            f"{' in ' + symbol.procedure_name if symbol.procedure_name else ''}"
+            f"{' in ' + symbol.function_name if symbol.function_name else ''}"
+            for node_id, symbol in self.st.symbols.items()
+        )
+        lines.append("=== END SYMBOL TABLE REPORT ===\n")
+        print("\n".join(lines))
 
 # ============================================================================
 # TYPE ANALYZER
 # ============================================================================
 
+def flatten_algo(algo: AlgoNode) -> List[InstrNode]:
+    """
+    All instructions of algo in pre-order: each loop/branch is followed by
+    its body (then-branch, then else-branch). Uses an explicit stack.
+    """
+    flat: List[InstrNode] = []
+    add = flat.append
+    stack = [iter(algo.instructions)]
+    push = stack.append
+    while stack:
+        instr = next(stack[-1], None)
+        if instr is None:
+            stack.pop()
+            continue
+        add(instr)
+        kind = instr.KIND
+        if kind == KIND_LOOP:
+            if instr.body:
+                push(iter(instr.body.instructions))
+        elif kind == KIND_BRANCH:
+            # pushed in reverse so the then-branch is drained first
+            if instr.else_branch:
+                push(iter(instr.else_branch.instructions))
+            if instr.then_branch:
+                push(iter(instr.then_branch.instructions))
+    return flat
+
+# Every type-analysis pass gets its own number; a TERM's var_type is only
+# trusted by the pass that stamped it
+_TYPE_PASSES = itertools.count(1)
+
+# Operator -> operator-type tables for the UNOP / BINOP typing rules
+_UNOP_TYPES: Dict[str, VarType] = {
+    'neg': VarType.NUMERIC,
+    'not': VarType.BOOLEAN,
+}
+
+_BINOP_TYPES: Dict[str, VarType] = {
+    '>': VarType.COMPARISON,
+    'eq': VarType.COMPARISON,
+    'or': VarType.BOOLEAN,
+    'and': VarType.BOOLEAN,
+    'plus': VarType.NUMERIC,
+    'minus': VarType.NUMERIC,
+    'mult': VarType.NUMERIC,
+    'div': VarType.NUMERIC,
+}
+
 class TypeAnalyzer:
     """
     COS341 Type Analyzer - Implements formal type analysis rules for SPL
     """
     
-    def __init__(self, ast: ProgramNode, symbol_table: SymbolTable):
-        self.ast = ast
-        self.st = symbol_table
+    def __init__(self, ast: ProgramNode, symbol_table: SymbolTable, verbose: bool = False,
+                 def_cache: Optional[Dict[Any, bool]] = None):
+        self.ast: ProgramNode = ast
+        self.st: SymbolTable = symbol_table
+        self.verbose: bool = verbose
+        # Incremental mode: pass the same dict to the analyzer of each new
+        # version of a program and unchanged procedures/functions (by
+        # ast_content_key) are not re-checked
+        self.def_cache: Optional[Dict[Any, bool]] = def_cache
+        # Checker per instruction type; loops/branches only check their own
+        # condition, their bodies are reached by flatten_algo or the
+        # SemanticAnalyzer walk
+        self._local_instr_dispatch: Dict[int, Callable[[Any], bool]] = {
+            KIND_PRINT: self.check_print,
+            KIND_CALL: self.check_call_instr,
+            KIND_ASSIGN: self.check_assign,
+            KIND_LOOP: self.check_loop_condition,
+            KIND_BRANCH: self.check_branch_condition,
+        }
+        self._term_dispatch: Dict[int, Callable[[Any], VarType]] = {
+            KIND_ATOM_TERM: self.get_atom_term_type,
+            KIND_UNOP_TERM: self.get_unop_term_type,
+            KIND_BINOP_TERM: self.get_binop_term_type,
+        }
+        self._type_pass = next(_TYPE_PASSES)
+        # Types of nodes that are not TERMs and so have no fields for it
+        self._odd_term_types: Dict[int, VarType] = {}
+        # Pending (format, args) errors; formatted and handed to the symbol
+        # table once, at the end of analyze()
+        self._errors: List[Tuple[str, tuple]] = []
+        
+    def report(self, fmt: str, *args: Any) -> None:
+        """Queue a type error; it is formatted (fmt % args) when flushed."""
+        self._errors.append((fmt, args))
+    
+    def reset_errors(self) -> None:
+        """Drop queued errors that have not been flushed yet."""
+        self._errors.clear()
+    
+    def flush(self) -> None:
+        """Hand the queued errors to the symbol table."""
+        for fmt, args in self._errors:
+            self.st.add_error(fmt % args if args else fmt)
+        self._errors.clear()
+        
+    def forget_term_types(self):
+        """Start a new pass: TERM types from earlier passes are recomputed"""
+        self._type_pass = next(_TYPE_PASSES)
+        self._odd_term_types.clear()
         
     def analyze(self) -> bool:
-        print("Phase 4: Type Analysis (COS341 Formal Rules)...")
+        self.forget_term_types()
+        if not self.ast:
+            return self.finish(False)
         
+        # Stop at the first section that fails to type-check
+        try:
+            is_correctly_typed = (self.check_procdefs(self.ast.procedures) and
+                                  self.check_funcdefs(self.ast.functions) and
+                                  self.check_mainprog(self.ast.main))
+        finally:
+            self.flush()
+        return self.finish(is_correctly_typed)
+    
+    def finish(self, is_correctly_typed: bool) -> bool:
+        """Hand pending errors to the symbol table and report the result."""
+        if self.verbose:
+            print("Phase 4: Type Analysis (COS341 Formal Rules)...")
         if not self.ast:
             self.st.add_error("AST is None - cannot perform type analysis")
             return False
-            
-        variables_correct = self.check_variables(self.ast.variables)
-        procdefs_correct = self.check_procdefs(self.ast.procedures)
-        funcdefs_correct = self.check_funcdefs(self.ast.functions)
-        mainprog_correct = self.check_mainprog(self.ast.main)
-        
-        is_correctly_typed = (variables_correct and procdefs_correct and 
-                            funcdefs_correct and mainprog_correct)
+        self.flush()
         
-        if is_correctly_typed:
-            print("Type analysis passed - program is correctly typed")
-        else:
-            print("Type analysis failed - program has type errors \n")
+        if self.verbose:
+            if is_correctly_typed:
+                print("Type analysis passed - program is correctly typed")
+            else:
+                print("Type analysis failed - program has type errors \n")
         return is_correctly_typed
     
-    def check_variables(self, variables: List[str]) -> bool:
-        return True
-    
     def check_procdefs(self, procedures: List[ProcDefNode]) -> bool:
+        check_pdef = self.check_pdef
         for proc in procedures:
-            if not self.check_pdef(proc):
+            if not check_pdef(proc):
                 return False
         return True
     
     def check_pdef(self, proc: ProcDefNode) -> bool:
-        param_correct = self.check_param(proc.params)
-        body_correct = self.check_body(proc.local_vars, proc.body)
-        if not (param_correct and body_correct):
-            self.st.add_error(f"Procedure '{proc.name}' is not correctly typed")
+        key = self._def_key(proc)
+        if key is not None and key in self.def_cache:
+            return True
+        if not (self.check_maxthree(proc.params) and
+                self.check_body(proc.local_vars, proc.body)):
+            self.report("Procedure '%s' is not correctly typed", proc.name)
             return False
+        self._store_def_key(key)
         return True
     
     def check_funcdefs(self, functions: List[FuncDefNode]) -> bool:
+        check_fdef = self.check_fdef
         for func in functions:
-            if not self.check_fdef(func):
+            if not check_fdef(func):
                 return False
         return True
     
     def check_fdef(self, func: FuncDefNode) -> bool:
-        param_correct = self.check_param(func.params)
-        body_correct = self.check_body(func.local_vars, func.body)
-        atom_correct = False
-        if func.return_atom:
-            atom_type = self.get_atom_type(func.return_atom)
-            atom_correct = (atom_type == VarType.NUMERIC)
-            if not atom_correct:
-                self.st.add_error(f"Function '{func.name}' return value is not of type 'numeric'")
-        else:
-            self.st.add_error(f"Function '{func.name}' missing return statement")
-        
-        if not (param_correct and body_correct and atom_correct):
-            self.st.add_error(f"Function '{func.name}' is not correctly typed")
+        key = self._def_key(func)
+        if key is not None and key in self.def_cache:
+            return True
+        if not (self.check_maxthree(func.params) and
+                self.check_body(func.local_vars, func.body) and
+                self.check_return(func)):
+            self.report("Function '%s' is not correctly typed", func.name)
+            return False
+        self._store_def_key(key)
+        return True
+    
+    def _def_key(self, node: ASTNode) -> Any:
+        return ast_content_key(node) if self.def_cache is not None else None
+    
+    def _store_def_key(self, key: Any):
+        # Only successes are cached so failures are re-reported every run
+        if key is not None:
+            self.def_cache[key] = True
+    
+    def check_return(self, func: FuncDefNode) -> bool:
+        # every ATOM is numeric (fact rule), so only presence is checked
+        if not func.return_atom:
+            self.report("Function '%s' missing return statement", func.name)
             return False
         return True
     
     def check_mainprog(self, main: MainProgNode) -> bool:
         if not main:
-            self.st.add_error("Main program is missing")
+            self.report("Main program is missing")
             return False
-        variables_correct = self.check_variables(main.variables)
-        algo_correct = self.check_algo(main.body)
-        if not (variables_correct and algo_correct):
-            self.st.add_error("Main program is not correctly typed")
+        if not self.check_algo(main.body):
+            self.report("Main program is not correctly typed")
             return False
         return True
     
     def check_body(self, local_vars: List[str], body: AlgoNode) -> bool:
-        maxthree_correct = self.check_maxthree(local_vars)
-        algo_correct = self.check_algo(body)
-        return maxthree_correct and algo_correct
-    
-    def check_param(self, params: List[str]) -> bool:
-        return self.check_maxthree(params)
+        return self.check_maxthree(local_vars) and self.check_algo(body)
     
     def check_maxthree(self, vars_list: List[str]) -> bool:
-        if len(vars_list) > 3:
-            self.st.add_error(f"Too many variables in MAXTHREE: {len(vars_list)} (max 3)")
-            return False
+        # parse_maxthree never reads more than three names
+        assert len(vars_list) <= 3, f"Too many variables in MAXTHREE: {len(vars_list)} (max 3)"
         return True
     
     def check_algo(self, algo: AlgoNode) -> bool:
         if not algo:
             return True
-        for instr in algo.instructions:
-            if not self.check_instr(instr):
-                return False
-        return True
+        # Any failing instruction fails the whole ALGO; nested blocks are
+        # checked in pre-order through the flattened block.
+        # Instructions are grouped by KIND and each group is checked in
+        # one loop with its handler looked up once.
+        groups: Dict[int, List[Tuple[int, InstrNode]]] = {}
+        group_for = groups.setdefault
+        for index, instr in enumerate(flatten_algo(algo)):
+            group_for(instr.KIND, []).append((index, instr))
+        
+        # Well-typed instructions never emit errors, so only the errors of
+        # the earliest failing instruction are kept; that is exactly what
+        # the sequential check would have reported
+        errors = self._errors
+        base = len(errors)
+        failed_at: Optional[int] = None
+        failed_errors: List[Tuple[str, tuple]] = []
+        dispatch = self._local_instr_dispatch
+        report = self.report
+        for kind, group in groups.items():
+            if kind == KIND_HALT:
+                continue
+            handler = dispatch.get(kind)
+            for index, instr in group:
+                if failed_at is not None and index > failed_at:
+                    break
+                mark = len(errors)
+                if handler is None:
+                    report("Unknown instruction type: %s", type(instr))
+                elif handler(instr):
+                    continue
+                failed_at = index
+                failed_errors = errors[mark:]
+                break
+        del errors[base:]
+        if failed_at is None:
+            return True
+        errors.extend(failed_errors)
+        return False
     
-    def check_instr(self, instr: InstrNode) -> bool:
-        if isinstance(instr, HaltNode):
-            return self.check_halt(instr)
-        elif isinstance(instr, PrintNode):
-            return self.check_print(instr)
-        elif isinstance(instr, CallNode):
-            return self.check_call_instr(instr)
-        elif isinstance(instr, AssignNode):
-            return self.check_assign(instr)
-        elif isinstance(instr, LoopNode):
-            return self.check_loop(instr)
-        elif isinstance(instr, BranchNode):
-            return self.check_branch(instr)
-        else:
-            self.st.add_error(f"Unknown instruction type: {type(instr)}")
+    def check_instr_local(self, instr: InstrNode) -> bool:
+        """Check instr itself without descending into nested ALGO bodies."""
+        kind = instr.KIND
+        # halt is always correctly typed
+        if kind == KIND_HALT:
+            return True
+        handler = self._local_instr_dispatch.get(kind)
+        if handler is None:
+            self.report("Unknown instruction type: %s", type(instr))
             return False
-    
-    def check_halt(self, halt: HaltNode) -> bool:
-        return True
+        return handler(instr)
     
     def check_print(self, print_node: PrintNode) -> bool:
         return self.check_output(print_node.output, print_node.is_string)
@@ -1420,199 +1806,430 @@ class TypeAnalyzer:
         return self.check_input(call.args)
     
     def check_assign(self, assign: AssignNode) -> bool:
-        if assign.is_func_call and isinstance(assign.expr, CallNode):
+        expr_kind = node_kind(assign.expr)
+        if assign.is_func_call and expr_kind == KIND_CALL:
             return self.check_input(assign.expr.args)
-        elif isinstance(assign.expr, TermNode):
+        elif expr_kind == KIND_ATOM_TERM:
+            # an ATOM term is numeric by the fact rule
+            return True
+        elif expr_kind in self._term_dispatch:
             term_type = self.get_term_type(assign.expr)
-            if term_type != VarType.NUMERIC:
-                self.st.add_error(f"Assignment to '{assign.var}': TERM is not of type 'numeric'")
+            if term_type is not VarType.NUMERIC:
+                self.report("Assignment to '%s': TERM is not of type 'numeric'", assign.var)
                 return False
             return True
         else:
-            self.st.add_error(f"Invalid assignment expression type for '{assign.var}'")
+            self.report("Invalid assignment expression type for '%s'", assign.var)
             return False
     
-    def check_loop(self, loop: LoopNode) -> bool:
+    def check_loop_condition(self, loop: LoopNode) -> bool:
         if loop.condition:
             term_type = self.get_term_type(loop.condition)
-            if term_type != VarType.BOOLEAN:
-                self.st.add_error(f"Loop condition TERM must be 'boolean', got '{term_type.value}'")
+            if term_type is not VarType.BOOLEAN:
+                self.report("Loop condition TERM must be 'boolean', got '%s'", term_type.value)
                 return False
-        algo_correct = self.check_algo(loop.body)
-        return algo_correct
+        return True
     
-    def check_branch(self, branch: BranchNode) -> bool:
+    def check_branch_condition(self, branch: BranchNode) -> bool:
         if branch.condition:
             term_type = self.get_term_type(branch.condition)
-            if term_type not in [VarType.BOOLEAN, VarType.NUMERIC]:
-                self.st.add_error(f"Branch condition TERM must be 'boolean' or 'numeric', got '{term_type.value}'")
+            if term_type is not VarType.BOOLEAN and term_type is not VarType.NUMERIC:
+                self.report("Branch condition TERM must be 'boolean' or 'numeric', got '%s'", term_type.value)
                 return False
-        then_correct = self.check_algo(branch.then_branch)
-        else_correct = True
-        if branch.else_branch:
-            else_correct = self.check_algo(branch.else_branch)
-        return then_correct and else_correct
+        return True
     
-    def check_output(self, output, is_string: bool) -> bool:
+    def check_output(self, output: Any, is_string: bool) -> bool:
         if is_string:
             return True
         else:
-            if isinstance(output, AtomNode):
-                atom_type = self.get_atom_type(output)
-                if atom_type != VarType.NUMERIC:
-                    self.st.add_error("OUTPUT ATOM is not of type 'numeric'")
-                    return False
+            if type(output) is AtomNode:
                 return True
             else:
-                self.st.add_error("Invalid OUTPUT type")
+                self.report("Invalid OUTPUT type")
                 return False
     
     def check_input(self, args: List[AtomNode]) -> bool:
-        if len(args) > 3:
-            self.st.add_error(f"Too many arguments in INPUT: {len(args)} (max 3)")
-            return False
-        for i, arg in enumerate(args):
-            atom_type = self.get_atom_type(arg)
-            if atom_type != VarType.NUMERIC:
-                self.st.add_error(f"INPUT argument {i+1} is not of type 'numeric'")
-                return False
+        # parse_input never reads more than three atoms
+        assert len(args) <= 3, f"Too many arguments in INPUT: {len(args)} (max 3)"
+        # every ATOM argument is numeric (fact rule)
         return True
     
-    def get_atom_type(self, atom: AtomNode) -> VarType:
-        if not atom.is_var:
-            return VarType.NUMERIC
-        else:
-            return VarType.NUMERIC
-    
     def get_term_type(self, term: TermNode) -> VarType:
-        if isinstance(term, AtomTermNode):
-            return self.get_atom_type(term.atom)
-        elif isinstance(term, UnopTermNode):
-            return self.get_unop_term_type(term)
-        elif isinstance(term, BinopTermNode):
-            return self.get_binop_term_type(term)
-        else:
-            self.st.add_error(f"Unknown TERM type: {type(term)}")
-            return VarType.TYPELESS
+        # Terms are not modified during type checking, so a subterm's type
+        # only has to be computed once per pass; it is kept on the node
+        dispatch = self._term_dispatch
+        stamp = self._type_pass
+        if node_kind(term) in dispatch and term.type_pass == stamp:
+            return term.var_type
+        
+        # Post-order walk with an explicit stack: children are typed (and
+        # stamped) before their parent, so the unop/binop rules below never
+        # recurse and deep TERMs cannot hit the recursion limit
+        odd = self._odd_term_types
+        stack = [(term, False)]
+        push = stack.append
+        pop = stack.pop
+        while stack:
+            node, ready = pop()
+            kind = node_kind(node)
+            handler = dispatch.get(kind)
+            if handler is None:
+                if id(node) not in odd:
+                    self.report("Unknown TERM type: %s", type(node))
+                    odd[id(node)] = VarType.TYPELESS
+                continue
+            if node.type_pass == stamp:
+                continue
+            if not ready:
+                push((node, True))
+                if kind == KIND_BINOP_TERM:
+                    push((node.right, False))
+                    push((node.left, False))
+                elif kind == KIND_UNOP_TERM:
+                    push((node.term, False))
+                continue
+            # Also read by later phases without re-running the checker
+            node.var_type = handler(node)
+            node.type_pass = stamp
+        if node_kind(term) in dispatch:
+            return term.var_type
+        return odd[id(term)]
+    
+    def get_atom_term_type(self, term: AtomTermNode) -> VarType:
+        return VarType.NUMERIC
     
     def get_unop_term_type(self, term: UnopTermNode) -> VarType:
         operand_type = self.get_term_type(term.term)
         unop_type = self.get_unop_type(term.op)
-        if unop_type == VarType.NUMERIC and operand_type == VarType.NUMERIC:
+        if unop_type is VarType.NUMERIC and operand_type is VarType.NUMERIC:
             return VarType.NUMERIC
-        elif unop_type == VarType.BOOLEAN:
-            if operand_type in [VarType.BOOLEAN, VarType.NUMERIC]:
+        elif unop_type is VarType.BOOLEAN:
+            if operand_type is VarType.BOOLEAN or operand_type is VarType.NUMERIC:
                 return VarType.BOOLEAN
             else:
-                self.st.add_error(f"UNOP '{term.op}' requires 'boolean' or 'numeric' operand, got '{operand_type.value}'")
+                self.report("UNOP '%s' requires 'boolean' or 'numeric' operand, got '%s'",
+                            term.op, operand_type.value)
                 return VarType.TYPELESS
         else:
-            self.st.add_error(f"UNOP '{term.op}' type mismatch: operator is {unop_type.value}, operand is {operand_type.value}")
+            self.report("UNOP '%s' type mismatch: operator is %s, operand is %s",
+                        term.op, unop_type.value, operand_type.value)
             return VarType.TYPELESS
     
     def get_binop_term_type(self, term: BinopTermNode) -> VarType:
         left_type = self.get_term_type(term.left)
         right_type = self.get_term_type(term.right)
         binop_type = self.get_binop_type(term.op)
-        if binop_type == VarType.NUMERIC:
-            if left_type == VarType.NUMERIC and right_type == VarType.NUMERIC:
+        if binop_type is VarType.NUMERIC:
+            if left_type is VarType.NUMERIC and right_type is VarType.NUMERIC:
                 return VarType.NUMERIC
             else:
-                self.st.add_error(f"Numeric BINOP '{term.op}' requires both operands to be 'numeric', got {left_type.value} and {right_type.value}")
+                self.report("Numeric BINOP '%s' requires both operands to be 'numeric', got %s and %s",
+                            term.op, left_type.value, right_type.value)
                 return VarType.TYPELESS
-        elif binop_type == VarType.BOOLEAN:
-            if left_type == VarType.BOOLEAN and right_type == VarType.BOOLEAN:
+        elif binop_type is VarType.BOOLEAN:
+            if left_type is VarType.BOOLEAN and right_type is VarType.BOOLEAN:
                 return VarType.BOOLEAN
             else:
-                self.st.add_error(f"Boolean BINOP '{term.op}' requires operands to be 'boolean' or 'numeric', got {left_type.value} and {right_type.value}")
+                self.report("Boolean BINOP '%s' requires operands to be 'boolean' or 'numeric', got %s and %s",
+                            term.op, left_type.value, right_type.value)
                 return VarType.TYPELESS
-        elif binop_type == VarType.COMPARISON:
-            if left_type == VarType.NUMERIC and right_type == VarType.NUMERIC:
+        elif binop_type is VarType.COMPARISON:
+            if left_type is VarType.NUMERIC and right_type is VarType.NUMERIC:
                 return VarType.BOOLEAN
             else:
-                self.st.add_error(f"Comparison BINOP '{term.op}' requires both operands to be 'numeric', got {left_type.value} and {right_type.value}")
+                self.report("Comparison BINOP '%s' requires both operands to be 'numeric', got %s and %s",
+                            term.op, left_type.value, right_type.value)
                 return VarType.TYPELESS
         else:
-            self.st.add_error(f"Unknown BINOP type for '{term.op}': {binop_type.value}")
+            self.report("Unknown BINOP type for '%s': %s", term.op, binop_type.value)
             return VarType.TYPELESS
     
     def get_unop_type(self, op: str) -> VarType:
-        if op == 'neg':
-            return VarType.NUMERIC
-        elif op == 'not':
-            return VarType.BOOLEAN
-        else:
-            self.st.add_error(f"Unknown UNOP: {op}")
+        op_type = _UNOP_TYPES.get(op)
+        if op_type is None:
+            self.report("Unknown UNOP: %s", op)
             return VarType.TYPELESS
+        return op_type
     
     def get_binop_type(self, op: str) -> VarType:
-        if op in ['>', 'eq']:
-            return VarType.COMPARISON
-        elif op in ['or', 'and']:
-            return VarType.BOOLEAN
-        elif op in ['plus', 'minus', 'mult', 'div']:
-            return VarType.NUMERIC
-        else:
-            self.st.add_error(f"Unknown BINOP: {op}")
+        op_type = _BINOP_TYPES.get(op)
+        if op_type is None:
+            self.report("Unknown BINOP: %s", op)
             return VarType.TYPELESS
+        return op_type
+
+# ============================================================================
+# SEMANTIC ANALYZER - SCOPE AND TYPE ANALYSIS IN ONE AST WALK
+# ============================================================================
+
+class SemanticAnalyzer(ScopeAnalyzer):
+    """
+    Runs the NAME-SCOPE-RULES walk and type-checks each instruction as the
+    walk reaches it, so the AST is traversed once instead of twice.
+    Type errors are held back until finish_type_analysis(), which reports
+    exactly what TypeAnalyzer.analyze() would have.
+    """
+    
+    def __init__(self, ast: ProgramNode, symbol_table: SymbolTable, verbose: bool = False):
+        super().__init__(ast, symbol_table)
+        self.types = TypeAnalyzer(ast, symbol_table, verbose)
+        # False once a section has failed to type-check; later sections are
+        # then skipped, like the fail-fast chain in TypeAnalyzer.analyze()
+        self._typing = True
+        # Whether the definition currently being walked is still well typed
+        self._def_typed = False
+    
+    def analyze(self):
+        self.types.forget_term_types()
+        self.types.reset_errors()
+        self._typing = True
+        super().analyze()
+    
+    def finish_type_analysis(self) -> bool:
+        return self.types.finish(self._typing)
+    
+    def _begin_definition(self, params: List[str], local_vars: List[str]) -> bool:
+        types = self.types
+        self._def_typed = (self._typing and types.check_maxthree(params) and
+                           types.check_maxthree(local_vars))
+        return self._typing
+    
+    def _end_definition(self, typing: bool, fmt: str, *args):
+        if typing and not self._def_typed:
+            self.types.report(fmt, *args)
+            self._typing = False
+        self._def_typed = False
+    
+    def analyze_procedure_local_scope(self, proc: ProcDefNode):
+        typing = self._begin_definition(proc.params, proc.local_vars)
+        super().analyze_procedure_local_scope(proc)
+        self._end_definition(typing, "Procedure '%s' is not correctly typed", proc.name)
+    
+    def analyze_function_local_scope(self, func: FuncDefNode):
+        typing = self._begin_definition(func.params, func.local_vars)
+        super().analyze_function_local_scope(func)
+        if self._def_typed:
+            self._def_typed = self.types.check_return(func)
+        self._end_definition(typing, "Function '%s' is not correctly typed", func.name)
+    
+    def analyze_main_scope(self):
+        typing = self._typing
+        if not self.ast.main:
+            if typing:
+                self.types.report("Main program is missing")
+                self._typing = False
+            return
+        self._def_typed = typing
+        super().analyze_main_scope()
+        self._end_definition(typing, "Main program is not correctly typed")
+    
+    def analyze_instruction_variables(self, instr: InstrNode, ctx: ScopeContext):
+        if self._def_typed:
+            self._def_typed = self.types.check_instr_local(instr)
+        super().analyze_instruction_variables(instr, ctx)
 
 # ============================================================================
 # CODE GENERATOR - NON-INLINED, BASIC-COMPATIBLE SUBROUTINES (GOSUB/RETURN)
 # ============================================================================
 
+# Intermediate instruction opcodes. The generator builds (opcode, operands)
+# tuples and renders them to text once, at the end of generate().
+# Jumps (GOTO, GOSUB, IF) are numbered last: opcode >= OP_GOTO means jump
+OP_LABEL = 0    # (name,)          -> "name:"
+OP_STOP = 1     # ()               -> "STOP"
+OP_RETURN = 2   # ()               -> "RETURN"
+OP_PRINT = 3    # (value,)         -> "PRINT value"
+OP_LET = 4      # (dst, rhs)       -> "LET dst = rhs"
+OP_ASSIGN = 5   # (dst, rhs)       -> "dst = rhs"
+OP_GOTO = 6     # (label,)         -> "GOTO label"
+OP_GOSUB = 7    # (label,)         -> "GOSUB label"
+OP_IF = 8       # (cond, label)    -> "IF cond THEN label"
+
+_OP_FORMATS = {
+    OP_LABEL: "{0}:",
+    OP_STOP: "STOP",
+    OP_RETURN: "RETURN",
+    OP_PRINT: "PRINT {0}",
+    OP_LET: "LET {0} = {1}",
+    OP_ASSIGN: "{0} = {1}",
+    OP_GOTO: "GOTO {0}",
+    OP_GOSUB: "GOSUB {0}",
+    OP_IF: "IF {0} THEN {1}",
+}
+
+Op = Tuple[int, tuple]
+# Branch/loop labels are int ids from new_label(); gotomain, proc_* and
+# func_* are named. Ids are only turned into l<n> text when rendered.
+Label = Union[int, str]
+
+# Right-hand side templates for unary/binary term temps
+_UNOP_FMT = {'neg': '- {}', 'not': 'NOT {}'}
+_BINOP_FMT = {'plus': '{} + {}', 'minus': '{} - {}', 'mult': '{} * {}', 'div': '{} / {}',
+              'eq': '{} = {}', '>': '{} > {}', 'and': '{} AND {}', 'or': '{} OR {}'}
+# Binary ops an IF can test directly
+_COND_OPS = {'eq': '=', '>': '>'}
+
+# Interned t<n>/l<n> names, shared by all generators and grown on demand
+_TEMP_POOL: List[str] = []
+_LABEL_POOL: List[str] = []
+
+def _pooled_name(pool: List[str], prefix: str, n: int) -> str:
+    if n >= len(pool):
+        pool.extend(sys.intern(f"{prefix}{j}") for j in range(len(pool), n + 64))
+    return pool[n]
+
+def fold_constant_term(term: Any) -> Any:
+    """
+    Value of a term built only from number literals, or None. Arithmetic
+    gives an int, eq/>/and/or/not give a bool. Division is not folded.
+    """
+    kind = node_kind(term)
+    if kind == KIND_ATOM_TERM:
+        atom = term.atom
+        return None if atom is None or atom.is_var else atom.value
+    if kind == KIND_UNOP_TERM:
+        v = fold_constant_term(term.term)
+        if term.op == 'neg' and type(v) is int:
+            return -v
+        if term.op == 'not' and type(v) is bool:
+            return not v
+        return None
+    if kind == KIND_BINOP_TERM:
+        l = fold_constant_term(term.left)
+        if l is None:
+            return None
+        r = fold_constant_term(term.right)
+        if r is None or type(l) is not type(r):
+            return None
+        op = term.op
+        if type(l) is int:
+            if op == 'plus':
+                return l + r
+            if op == 'minus':
+                return l - r
+            if op == 'mult':
+                return l * r
+            if op == 'eq':
+                return l == r
+            if op == '>':
+                return l > r
+        else:
+            if op == 'and':
+                return l and r
+            if op == 'or':
+                return l or r
+    return None
+
+# Operand refs in an emitted-line template of a term (CodeGenerator._emit_cache):
+TEMPLATE_TEMP = 0   # index of an earlier line of the same template
+TEMPLATE_VAR = 1    # source variable name, mapped for the current owner
+TEMPLATE_TEXT = 2   # literal text
+
+def label_name(label: Label) -> str:
+    return _pooled_name(_LABEL_POOL, "l", label) if type(label) is int else label
+
+# Operand position holding a label, per opcode
+_LABEL_SLOT = {OP_LABEL: 0, OP_GOTO: 0, OP_GOSUB: 0, OP_IF: 1}
+
+def format_op(opcode: int, operands: tuple) -> str:
+    return _OP_FORMATS[opcode].format(*operands)
+
+def strip_not(term: Any) -> Tuple[Any, bool]:
+    """Peel 'not' wrappers off a condition: (inner term, whether negated)"""
+    negated = False
+    while node_kind(term) == KIND_UNOP_TERM and term.op == 'not':
+        term = term.term
+        negated = not negated
+    return term, negated
+
+def render_parts(opcode: int, operands: tuple) -> str:
+    slot = _LABEL_SLOT.get(opcode)
+    if slot is not None and type(operands[slot]) is int:
+        operands = operands[:slot] + (label_name(operands[slot]),) + operands[slot + 1:]
+    return _OP_FORMATS[opcode].format(*operands)
+
 class CodeGenerator:
     def __init__(self, ast: ProgramNode, symbol_table: SymbolTable):
         self.ast = ast
         self.st = symbol_table
+        # Ops are collected as (opcode, operands) tuples while generating;
+        # generate() then moves them into columnar opcode/operand arrays
+        self.ops: List[Op] = []
+        self.opcodes: array = array('B')
+        self.operands: List[tuple] = []
         self.code: List[str] = []
+        self.label_lines: Dict[Label, int] = {}
+        self.final_code: List[str] = []
         self.temp_counter = 0
         self.label_counter = 0
+        self._instr_dispatch: Dict[int, Callable[..., None]] = {
+            KIND_HALT: self.generate_halt,
+            KIND_PRINT: self.generate_print,
+            KIND_ASSIGN: self.generate_assign,
+            KIND_CALL: self.generate_call,
+            KIND_BRANCH: self.generate_branch,
+            KIND_LOOP: self.generate_loop,
+        }
+        # Common-subexpression memo for straight-line code: term_key -> temp,
+        # plus var -> {term_key} so an assignment can drop what it invalidates
+        self._term_memo: Dict[tuple, str] = {}
+        self._term_memo_uses: Dict[str, Set[tuple]] = {}
+        # Terms that generate_condition can fold into the IF line itself
+        self._cond_dispatch: Dict[int, Callable[..., Optional[str]]] = {
+            KIND_BINOP_TERM: self.generate_binop_condition,
+        }
+        # owner -> {source name: emitted name}, filled by map_var
+        self._var_names: Dict[Tuple[str, Optional[str]], Dict[str, str]] = {}
+        # owner -> its params and locals, built once per proc/func
+        self._local_names: Dict[Tuple[str, Optional[str]], AbstractSet[str]] = {}
+        # Emitted-line templates of terms, by term_key, so a term seen earlier
+        # in this program (in any unit) is re-emitted without a walk
+        self._emit_cache: Dict[tuple, Tuple[frozenset, list]] = {}
 
     def new_temp(self) -> str:
         self.temp_counter += 1
-        return f"t{self.temp_counter}"
+        return _pooled_name(_TEMP_POOL, "t", self.temp_counter)
 
-    def new_label(self) -> str:
+    def new_label(self) -> int:
         self.label_counter += 1
-        return f"l{self.label_counter}"
+        return self.label_counter
 
-    def emit(self, s: str):
-        trimmed = s.strip()
-        if "=" in trimmed and not trimmed.startswith(("PRINT", "IF", "GOTO", "GOSUB", "RETURN", "STOP")):
-            s = "LET " + s
-        self.code.append(s)
+    def emit(self, opcode: int, *operands):
+        self.ops.append((opcode, operands))
 
     def generate(self) -> List[str]:
         """
         Emit intermediate BASIC-like code with labels (using "label:"), no REM.
         - Subroutines (procedures/functions) are placed first.
         - Main is placed after, with initial GOTO mainstart to avoid fallthrough.
-        Final numeric line mapping is done in process_labels_and_jumps().
+        Final numeric line mapping is done in assemble().
         """
         if not self.ast:
             return []
-        self.code = []
+        # Everything is emitted straight into self.ops in final order,
+        # starting with the initial jump over the subroutines
+        self.ops = [(OP_GOTO, ("gotomain",))]
 
         # Emit procedures
         for p in self.ast.procedures:
-            self.emit(f"proc_{p.name}:")  # internal label; will be removed, mapped to numbers
+            self.emit(OP_LABEL, f"proc_{p.name}")  # internal label; will be removed, mapped to numbers
             # Parameter load variables inside subroutine are named <name><param>
             # We expect caller to assign arg<name>1.. before GOSUB. Here we copy to locals if needed.
             # We keep it simple: directly use <name><param> as the working vars.
             for idx, param in enumerate(p.params, start=1):
-                self.emit(f"{p.name}{param} = arg{p.name}{idx}")
+                self.emit(OP_LET, f"{p.name}{param}", f"arg{p.name}{idx}")
             for lv in p.local_vars:
                 # locals don't need explicit init, but we keep the name scheme
                 pass
             if p.body:
                 self.generate_algo(p.body, owner=('proc', p.name))
-            self.emit("RETURN")
+            self.emit(OP_RETURN)
 
         # Emit functions
         for f in self.ast.functions:
-            self.emit(f"func_{f.name}:")
+            self.emit(OP_LABEL, f"func_{f.name}")
             for idx, param in enumerate(f.params, start=1):
-                self.emit(f"{f.name}{param} = arg{f.name}{idx}")
+                self.emit(OP_LET, f"{f.name}{param}", f"arg{f.name}{idx}")
             for lv in f.local_vars:
                 pass
             if f.body:
@@ -1620,153 +2237,379 @@ class CodeGenerator:
             # Function return value goes into retn
             if f.return_atom is not None:
                 if f.return_atom.is_var:
-                    self.emit(f"ret{f.name} = {f.name}{f.return_atom.value if f.return_atom.value in f.params + f.local_vars else f.return_atom.value}")
+                    self.emit(OP_LET, f"ret{f.name}", f"{f.name}{f.return_atom.value if f.return_atom.value in f.params + f.local_vars else f.return_atom.value}")
                 else:
-                    self.emit(f"ret{f.name} = {f.return_atom.value}")
+                    self.emit(OP_LET, f"ret{f.name}", f"{f.return_atom.value}")
             else:
-                self.emit(f"ret{f.name} = 0")
-            self.emit("RETURN")
+                self.emit(OP_LET, f"ret{f.name}", "0")
+            self.emit(OP_RETURN)
 
         # Emit main
-        self.emit("gotomain:")  # landing label for main start
-        if self.ast.main and self.ast.main.body:
-            # initial jump over subroutines
-            # We'll add the GOTO to gotomain at the very top after we know labels.
-            pass
-        # Insert initial jump at top now that labels exist
-        # We'll reorder by adding this at the beginning after everything else
-        main_block: List[str] = []
+        self.emit(OP_LABEL, "gotomain")  # landing label for main start
         # main variable prefixing is not necessary here; names are kept as-is
         if self.ast.main and self.ast.main.body:
-            self.generate_algo(self.ast.main.body, owner=('main', None), out=main_block)
-        # Place the initial jump and subroutines before main
-        self.code = [f"GOTO gotomain"] + self.code + ["gotomain:"] + main_block
+            self.generate_algo(self.ast.main.body, owner=('main', None))
+        self.opcodes, self.operands = split_ops(self.ops)
+        self.ops = []
+        self.strip_dead_labels()
 
+        self.assemble()
         return self.code
 
-    def generate_algo(self, algo: AlgoNode, owner: Tuple[str, Optional[str]], out: Optional[List[str]] = None):
-        sink = out if out is not None else self.code
+    def assemble(self):
+        """
+        Render self.opcodes/self.operands into self.code (the intermediate
+        listing with labels) and self.final_code (numbered, labels dropped),
+        and fill self.label_lines.
+        """
+        # Like a one-pass assembler: jumps to labels already seen get their
+        # line at once, forward jumps are patched when their label turns up
+        code: List[str] = []
+        final_code: List[str] = []
+        pairs: List[Tuple[Label, int]] = []
+        label_text: Dict[Label, str] = {}
+        fixups: Dict[Label, List[Tuple[int, int, tuple]]] = {}
+        for opcode, operands in zip(self.opcodes, self.operands):
+            line = render_parts(opcode, operands)
+            code.append(line)
+            if opcode == OP_LABEL:
+                label = operands[0]
+                lineno = len(final_code) + 1
+                pairs.append((label, lineno))
+                if label not in label_text:
+                    text = label_text[label] = str(lineno)
+                    for idx, jump, jump_operands in fixups.pop(label, ()):
+                        final_code[idx] = format_jump(jump, jump_operands, text)
+                continue
+            if opcode >= OP_GOTO:
+                target = operands[1] if opcode == OP_IF else operands[0]
+                text = label_text.get(target)
+                if text is not None:
+                    line = format_jump(opcode, operands, text)
+                else:
+                    # unresolved targets keep their rendered line
+                    fixups.setdefault(target, []).append((len(final_code), opcode, operands))
+            final_code.append(line)
+        self.code = code
+        self.final_code = final_code
+        self.label_lines = label_lines_from_pairs(pairs)
+
+    def forget_terms(self):
+        """Drop all memoized terms (at labels, calls and block boundaries)"""
+        self._term_memo.clear()
+        self._term_memo_uses.clear()
+
+    def forget_terms_using(self, var: str):
+        """Drop memoized terms that read var, after var is assigned"""
+        memo = self._term_memo
+        for key in self._term_memo_uses.pop(var, ()):
+            memo.pop(key, None)
+
+    def strip_dead_labels(self):
+        """
+        Peephole pass over self.opcodes/self.operands:
+        - drop a GOTO whose target label directly follows it (possibly among
+          other labels), since control falls through to it anyway
+        - drop labels that no GOTO/GOSUB/IF jumps to
+        Only the opcode array is scanned; operands are read on a match.
+        """
+        opcodes, operands = self.opcodes, self.operands
+        n = len(opcodes)
+        kept: List[int] = []
+        for i, opcode in enumerate(opcodes):
+            if opcode == OP_GOTO:
+                target = operands[i][0]
+                j = i + 1
+                while j < n and opcodes[j] == OP_LABEL and operands[j][0] != target:
+                    j += 1
+                if j < n and opcodes[j] == OP_LABEL:
+                    continue
+            kept.append(i)
+
+        refs: Set[Label] = set()
+        for i in kept:
+            opcode = opcodes[i]
+            if opcode == OP_GOTO or opcode == OP_GOSUB:
+                refs.add(operands[i][0])
+            elif opcode == OP_IF:
+                refs.add(operands[i][1])
+        kept = [i for i in kept if opcodes[i] != OP_LABEL or operands[i][0] in refs]
+        self.opcodes = array('B', [opcodes[i] for i in kept])
+        self.operands = [operands[i] for i in kept]
+
+    def generate_algo(self, algo: AlgoNode, owner: Tuple[str, Optional[str]], out: Optional[List[Op]] = None):
+        sink = out if out is not None else self.ops
+        self.forget_terms()
+        # generators append straight into the sink; no per-instruction list
+        dispatch = self._instr_dispatch
         for instr in algo.instructions:
-            for line in self.generate_instruction(instr, owner):
-                sink.append(line)
+            gen = dispatch.get(instr.KIND)
+            if gen is not None:
+                gen(instr, owner, sink)
 
-    def generate_instruction(self, instr: InstrNode, owner: Tuple[str, Optional[str]]) -> List[str]:
-        out: List[str] = []
-        kind, name = owner
+    def generate_halt(self, instr: HaltNode, owner: Tuple[str, Optional[str]], out: List[Op]):
+        out.append((OP_STOP, ()))
 
-        if isinstance(instr, HaltNode):
-            out.append("STOP")
-
-        elif isinstance(instr, PrintNode):
+    def generate_print(self, instr: PrintNode, owner: Tuple[str, Optional[str]], out: List[Op]):
+        kind = instr.kind
+        if kind is None:
+            # built without the parser
             if instr.is_string:
-                out.append(f"PRINT {instr.output}")
-            else:
-                val = self.generate_atom(instr.output, owner)
-                out.append(f"PRINT {val}")
-
-        elif isinstance(instr, AssignNode):
-            if instr.is_func_call and isinstance(instr.expr, CallNode):
-                # x = CALL f(args)
-                fname = instr.expr.name
-                # prepare args
-                for idx, a in enumerate(instr.expr.args, start=1):
-                    rhs = self.generate_atom(a, owner)
-                    out.append(f"arg{fname}{idx} = {rhs}")
-                # gosub
-                out.append(f"GOSUB func_{fname}")
-                # assign result
-                out.append(f"{self.map_var(instr.var, owner)} = ret{fname}")
+                kind = PRINT_STRING
             else:
-                t = self.generate_term(instr.expr, owner, out)
-                out.append(f"{self.map_var(instr.var, owner)} = {t}")
-
-        elif isinstance(instr, CallNode):
-            # CALL p(args)
-            pname = instr.name
-            for idx, a in enumerate(instr.args, start=1):
-                rhs = self.generate_atom(a, owner)
-                out.append(f"arg{pname}{idx} = {rhs}")
-            out.append(f"GOSUB proc_{pname}")
-
-        elif isinstance(instr, BranchNode):
-            label_t = self.new_label()
+                kind = PRINT_VAR if instr.output.is_var else PRINT_NUM
+            instr.kind = kind
+        if kind == PRINT_STRING:
+            out.append((OP_PRINT, (instr.output,)))
+        elif kind == PRINT_VAR:
+            out.append((OP_PRINT, (self.map_var(instr.output.value, owner),)))
+        else:
+            out.append((OP_PRINT, (str(instr.output.value),)))
+
+    def generate_assign(self, instr: AssignNode, owner: Tuple[str, Optional[str]], out: List[Op]):
+        if instr.is_func_call and node_kind(instr.expr) == KIND_CALL:
+            # x = CALL f(args)
+            fname = instr.expr.name
+            # prepare args
+            self.generate_args(fname, instr.expr.args, owner, out)
+            # gosub
+            out.append((OP_GOSUB, (f"func_{fname}",)))
+            # assign result
+            out.append((OP_ASSIGN, (self.map_var(instr.var, owner), f"ret{fname}")))
+            # the callee may have changed globals
+            self.forget_terms()
+        else:
+            t = self.generate_term(instr.expr, owner, out)
+            out.append((OP_ASSIGN, (self.map_var(instr.var, owner), t)))
+            self.forget_terms_using(instr.var)
+
+    def generate_call(self, instr: CallNode, owner: Tuple[str, Optional[str]], out: List[Op]):
+        # CALL p(args)
+        pname = instr.name
+        self.generate_args(pname, instr.args, owner, out)
+        out.append((OP_GOSUB, (f"proc_{pname}",)))
+        self.forget_terms()
+
+    def generate_args(self, callee: str, args: List[AtomNode], owner: Tuple[str, Optional[str]], out: List[Op]):
+        # arg<callee><i> = <atom>, one line per argument
+        gen_atom = self.generate_atom
+        out.extend([(OP_ASSIGN, (f"arg{callee}{idx}", gen_atom(a, owner)))
+                    for idx, a in enumerate(args, start=1)])
+
+    def generate_branch(self, instr: BranchNode, owner: Tuple[str, Optional[str]], out: List[Op]):
+        folded = fold_constant_term(instr.condition)
+        if type(folded) is bool:
+            # constant condition: only the taken side is generated
+            taken = instr.then_branch if folded else instr.else_branch
+            if taken:
+                self.generate_algo(taken, owner, out)
+                self.forget_terms()
+            return
+        label_t = self.new_label()
+        label_exit = self.new_label()
+        cond, negated = strip_not(instr.condition)
+        out.append(self.generate_condition(cond, label_t, owner, out))
+        # the IF falls through to the else block; under a 'not' the IF tests
+        # the inner term instead, so the two blocks trade places
+        if negated:
+            fall_through, jumped_to = instr.then_branch, instr.else_branch
+        else:
+            fall_through, jumped_to = instr.else_branch, instr.then_branch
+        if fall_through:
+            self.generate_algo(fall_through, owner, out)
+        out.append((OP_GOTO, (label_exit,)))
+        out.append((OP_LABEL, (label_t,)))
+        if jumped_to:
+            self.generate_algo(jumped_to, owner, out)
+        out.append((OP_LABEL, (label_exit,)))
+        self.forget_terms()
+
+    def generate_loop(self, instr: LoopNode, owner: Tuple[str, Optional[str]], out: List[Op]):
+        folded = fold_constant_term(instr.condition)
+        if instr.is_while and folded is False:
+            return
+        if not instr.is_while and folded is True:
+            # do ... until true runs the body exactly once
+            if instr.body:
+                self.generate_algo(instr.body, owner, out)
+                self.forget_terms()
+            return
+        # the loop head is a jump target
+        self.forget_terms()
+        cond, negated = strip_not(instr.condition)
+        if negated and instr.is_while:
+            # while (not c): leave as soon as c holds
+            label_start = self.new_label()
             label_exit = self.new_label()
-            cond_line = self.generate_condition(instr.condition, label_t, owner, out)
-            out.append(cond_line)
-            if instr.else_branch:
-                # else block first
-                if instr.else_branch:
-                    self.generate_algo(instr.else_branch, owner, out)
-                out.append(f"GOTO {label_exit}")
-                out.append(f"{label_t}:")
-                if instr.then_branch:
-                    self.generate_algo(instr.then_branch, owner, out)
-                out.append(f"{label_exit}:")
-            else:
-                out.append(f"GOTO {label_exit}")
-                out.append(f"{label_t}:")
-                if instr.then_branch:
-                    self.generate_algo(instr.then_branch, owner, out)
-                out.append(f"{label_exit}:")
-
-        elif isinstance(instr, LoopNode):
-            if instr.is_while:
-                label_start = self.new_label()
-                label_body = self.new_label()
-                label_exit = self.new_label()
-                out.append(f"{label_start}:")
-                cond_line = self.generate_condition(instr.condition, label_body, owner, out)
-                out.append(cond_line)
-                out.append(f"GOTO {label_exit}")
-                out.append(f"{label_body}:")
-                if instr.body:
-                    self.generate_algo(instr.body, owner, out)
-                out.append(f"GOTO {label_start}")
-                out.append(f"{label_exit}:")
-            else:
-                label_start = self.new_label()
-                label_exit = self.new_label()
-                out.append(f"{label_start}:")
-                if instr.body:
-                    self.generate_algo(instr.body, owner, out)
-                cond_line = self.generate_condition(instr.condition, label_exit, owner, out)
-                out.append(cond_line)
-                out.append(f"GOTO {label_start}")
-                out.append(f"{label_exit}:")
-        return out
-
-    def generate_condition(self, term: TermNode, true_label: str, owner: Tuple[str, Optional[str]], out: List[str]) -> str:
-        if isinstance(term, BinopTermNode) and term.op in ['eq', '>']:
-            l = self.generate_term(term.left, owner, out)
-            r = self.generate_term(term.right, owner, out)
-            op = '=' if term.op == 'eq' else '>'
-            return f"IF {l} {op} {r} THEN {true_label}"
+            out.append((OP_LABEL, (label_start,)))
+            out.append(self.generate_condition(cond, label_exit, owner, out))
+            if instr.body:
+                self.generate_algo(instr.body, owner, out)
+            out.append((OP_GOTO, (label_start,)))
+            out.append((OP_LABEL, (label_exit,)))
+            self.forget_terms()
+        elif negated:
+            # do ... until (not c): go round again while c holds
+            label_start = self.new_label()
+            out.append((OP_LABEL, (label_start,)))
+            if instr.body:
+                self.generate_algo(instr.body, owner, out)
+            out.append(self.generate_condition(cond, label_start, owner, out))
+            self.forget_terms()
+        elif instr.is_while:
+            label_start = self.new_label()
+            label_body = self.new_label()
+            label_exit = self.new_label()
+            out.append((OP_LABEL, (label_start,)))
+            out.append(self.generate_condition(instr.condition, label_body, owner, out))
+            out.append((OP_GOTO, (label_exit,)))
+            out.append((OP_LABEL, (label_body,)))
+            if instr.body:
+                self.generate_algo(instr.body, owner, out)
+            out.append((OP_GOTO, (label_start,)))
+            out.append((OP_LABEL, (label_exit,)))
+            self.forget_terms()
+        else:
+            label_start = self.new_label()
+            label_exit = self.new_label()
+            out.append((OP_LABEL, (label_start,)))
+            if instr.body:
+                self.generate_algo(instr.body, owner, out)
+            out.append(self.generate_condition(instr.condition, label_exit, owner, out))
+            out.append((OP_GOTO, (label_start,)))
+            out.append((OP_LABEL, (label_exit,)))
+            self.forget_terms()
+
+    def generate_condition(self, term: TermNode, true_label: Label, owner: Tuple[str, Optional[str]], out: List[Op]) -> Op:
+        gen = self._cond_dispatch.get(node_kind(term))
+        if gen is not None:
+            cond = gen(term, owner, out)
+            if cond is not None:
+                return (OP_IF, (cond, true_label))
         t = self.generate_term(term, owner, out)
-        return f"IF {t} THEN {true_label}"
+        return (OP_IF, (t, true_label))
 
-    def generate_term(self, term: TermNode, owner: Tuple[str, Optional[str]], out: List[str]) -> str:
-        if isinstance(term, AtomTermNode):
+    def generate_binop_condition(self, term: BinopTermNode, owner: Tuple[str, Optional[str]], out: List[Op]) -> Optional[str]:
+        # Comparisons go straight into the IF, without a temp
+        op = _COND_OPS.get(term.op)
+        if op is None:
+            return None
+        l = self.generate_term(term.left, owner, out)
+        r = self.generate_term(term.right, owner, out)
+        return f"{l} {op} {r}"
+
+    def generate_term(self, term: TermNode, owner: Tuple[str, Optional[str]], out: List[Op]) -> str:
+        # Iterative post-order walk. Work items are (term, expanded); operand
+        # results (atoms or temps) are kept on a stack until their parent is
+        # emitted. Terms have no side effects, so an identical term computed
+        # earlier in the same straight-line code reuses its temp.
+        root_kind = node_kind(term)
+        if root_kind == KIND_ATOM_TERM:
             return self.generate_atom(term.atom, owner)
-        elif isinstance(term, UnopTermNode):
-            inner = self.generate_term(term.term, owner, out)
-            t = self.new_temp()
-            if term.op == 'neg':
-                out.append(f"{t} = - {inner}")
-            elif term.op == 'not':
-                out.append(f"{t} = NOT {inner}")
+        memo = self._term_memo
+        root_key = term_key(term) if root_kind in _OP_TERM_KINDS else None
+        if root_key is not None:
+            t = memo.get(root_key)
+            if t is not None:
+                return t
+            template = self._emit_cache.get(root_key)
+            if template is not None and memo.keys().isdisjoint(template[0]):
+                return self.replay_term_template(template[1], owner, out)
+
+        generate_atom = self.generate_atom
+        results: List[str] = []
+        push_result = results.append
+        pop_result = results.pop
+        # Template of what this walk emits: refs are (TEMPLATE_TEMP, index),
+        # (TEMPLATE_VAR, name) or (TEMPLATE_TEXT, text). Only kept if no
+        # temp from outside this term was reused.
+        lines: List[Tuple[tuple, str, tuple]] = []
+        local: Dict[tuple, int] = {}
+        refs: List[Tuple[int, Any]] = []
+        push_ref = refs.append
+        pop_ref = refs.pop
+        reusable = True
+        stack: List[Tuple[Any, bool]] = [(term, False)]
+        push = stack.append
+        pop = stack.pop
+        while stack:
+            node, expanded = pop()
+            kind = node_kind(node)
+            if kind == KIND_ATOM_TERM:
+                push_result(generate_atom(node.atom, owner))
+                atom = node.atom
+                push_ref((TEMPLATE_VAR, atom.value) if atom.is_var else (TEMPLATE_TEXT, str(atom.value)))
+                continue
+            if kind not in _OP_TERM_KINDS:
+                push_result("0")
+                push_ref((TEMPLATE_TEXT, "0"))
+                continue
+            key = term_key(node)
+            if not expanded:
+                t = memo.get(key)
+                if t is not None:
+                    push_result(t)
+                    idx = local.get(key)
+                    if idx is None:
+                        reusable = False
+                        push_ref((TEMPLATE_TEXT, t))
+                    else:
+                        push_ref((TEMPLATE_TEMP, idx))
+                    continue
+                push((node, True))
+                if kind == KIND_BINOP_TERM:
+                    push((node.right, False))
+                    push((node.left, False))
+                else:
+                    push((node.term, False))
+                continue
+            if kind == KIND_BINOP_TERM:
+                r = pop_result()
+                l = pop_result()
+                fmt = _BINOP_FMT.get(node.op) or "{} " + node.op.upper() + " {}"
+                rhs = fmt.format(l, r)
+                r_ref = pop_ref()
+                operand_refs = (pop_ref(), r_ref)
             else:
-                out.append(f"{t} = {inner}")
-            return t
-        elif isinstance(term, BinopTermNode):
-            l = self.generate_term(term.left, owner, out)
-            r = self.generate_term(term.right, owner, out)
+                fmt = _UNOP_FMT.get(node.op, '{}')
+                rhs = fmt.format(pop_result())
+                operand_refs = (pop_ref(),)
+            t = self.new_temp()
+            out.append((OP_ASSIGN, (t, rhs)))
+            self.remember_term(key, t)
+            push_result(t)
+            local[key] = len(lines)
+            push_ref((TEMPLATE_TEMP, len(lines)))
+            lines.append((key, fmt, operand_refs))
+        if reusable and root_key is not None and lines:
+            self._emit_cache[root_key] = (frozenset(local), lines)
+        return results[-1]
+
+    def replay_term_template(self, lines: List[Tuple[tuple, str, tuple]],
+                             owner: Tuple[str, Optional[str]], out: List[Op]) -> str:
+        # Re-emit a cached term with fresh temps; same lines the walk would give
+        map_var = self.map_var
+        temps: List[str] = []
+        for key, fmt, operand_refs in lines:
+            args = []
+            for kind, value in operand_refs:
+                if kind == TEMPLATE_TEMP:
+                    args.append(temps[value])
+                elif kind == TEMPLATE_VAR:
+                    args.append(map_var(value, owner))
+                else:
+                    args.append(value)
             t = self.new_temp()
-            op_map = {'plus': '+', 'minus': '-', 'mult': '*', 'div': '/',
-                      'eq': '=', '>': '>', 'and': 'AND', 'or': 'OR'}
-            op = op_map.get(term.op, term.op.upper())
-            out.append(f"{t} = {l} {op} {r}")
-            return t
-        return "0"
+            out.append((OP_ASSIGN, (t, fmt.format(*args))))
+            self.remember_term(key, t)
+            temps.append(t)
+        return temps[-1]
+
+    def remember_term(self, key: tuple, temp: str):
+        self._term_memo[key] = temp
+        uses = self._term_memo_uses
+        for var in term_key_vars(key):
+            uses.setdefault(var, set()).add(key)
 
     def generate_atom(self, atom: AtomNode, owner: Tuple[str, Optional[str]]) -> str:
         if atom.is_var:
@@ -1775,143 +2618,111 @@ class CodeGenerator:
             return str(atom.value)
 
     def map_var(self, var: str, owner: Tuple[str, Optional[str]]) -> str:
+        # Each name is resolved once per owner (proc/func/main) and cached
+        names = self._var_names.get(owner)
+        if names is None:
+            names = self._var_names[owner] = {}
+        mapped = names.get(var)
+        if mapped is None:
+            mapped = names[var] = self._map_var(var, owner)
+        return mapped
+
+    def _map_var(self, var: str, owner: Tuple[str, Optional[str]]) -> str:
         kind, name = owner
         # temps stay as is (t1, t2...), digits only afterwards
         if var.startswith('t') and var[1:].isdigit():
             return var
-        if kind == 'proc' and name:
-            # params/locals of proc are referenced as <procname><var> when applicable
-            return f"{name}{var}" if var in self._proc_nameset(name) else var
-        if kind == 'func' and name:
-            return f"{name}{var}" if var in self._func_nameset(name) else var
+        if kind in ('proc', 'func') and name:
+            # params/locals of proc/func are referenced as <name><var> when applicable
+            return f"{name}{var}" if var in self._local_nameset(owner) else var
         # main/global as-is
         return var
 
-    def _proc_nameset(self, name: str) -> Set[str]:
-        p = next((x for x in self.ast.procedures if x.name == name), None)
-        return set(p.params + p.local_vars) if p else set()
-
-    def _func_nameset(self, name: str) -> Set[str]:
-        f = next((x for x in self.ast.functions if x.name == name), None)
-        return set(f.params + f.local_vars) if f else set()
+    def _local_nameset(self, owner: Tuple[str, Optional[str]]) -> AbstractSet[str]:
+        names = self._local_names.get(owner)
+        if names is None:
+            kind, name = owner
+            defs = self.ast.procedures if kind == 'proc' else self.ast.functions
+            d = next((x for x in defs if x.name == name), None)
+            names = self._local_names[owner] = (
+                frozenset(d.params + d.local_vars) if d else frozenset())
+        return names
 
 # ============================================================================
 # LABEL AND JUMP PROCESSING (no REM, numeric mapping, includes GOSUB)
 # ============================================================================
 
-def process_labels_and_jumps(intermediate_code: List[str]) -> Tuple[List[str], Dict[str, int]]:
+def label_lines_from_pairs(pairs: List[Tuple[Label, int]]) -> Dict[Label, int]:
     """
-    Process labels and resolve jumps to numeric targets without emitting REM lines.
-    - Lines ending with ':' define a label for the *next* executable line number.
-    - Supported control transfers: GOTO <label|num>, GOSUB <label|num>, IF ... THEN <label|num>
-    - Label declaration lines are DROPPED (not emitted).
-    - Output keeps original 1..N numbering that your driver prints (we don't add 10s here).
+    Label -> line dict from (label, line) pairs in program order. A repeated
+    label keeps its first line, and the dict comes out ordered by line.
     """
-    # First pass: determine which lines will actually be emitted and where labels point
-    label_map: Dict[str, int] = {}
-    executable_flags: List[bool] = []  # per original line, whether it will be emitted
-    stripped_lines: List[str] = []
-
-    # mark which original lines are labels (to be dropped)
-    for line in intermediate_code:
-        s = line.strip()
-        is_label = s.endswith(':')
-        executable_flags.append(not is_label)
-        stripped_lines.append(s)
-
-    # determine numeric indices (1-based) of emitted lines
-    emitted_index = 1
-    line_number_of_emitted: List[Optional[int]] = []
-    for is_exec in executable_flags:
-        if is_exec:
-            line_number_of_emitted.append(emitted_index)
-            emitted_index += 1
-        else:
-            line_number_of_emitted.append(None)
-
-    # map labels to the line number of the *next* emitted line
-    # (i.e., the first executable line after the label)
-    next_exec_after: Dict[int, int] = {}
-    next_num = None
-    for i in reversed(range(len(stripped_lines))):
-        if executable_flags[i]:
-            next_num = line_number_of_emitted[i]
-        else:
-            # label line: map to the next executable number seen so far
-            label_name = stripped_lines[i][:-1].strip()
-            if next_num is None:
-                # label at end: map to the next sequential number after all lines
-                next_num = emitted_index
-            label_map[label_name] = next_num
-
-    # Second pass: emit lines with label references resolved
-    final_code: List[str] = []
-    for i, s in enumerate(stripped_lines):
-        if not executable_flags[i]:
-            continue  # drop label lines
-
-        # resolve GOTO/GOSUB/THEN
-        out_line = s
-
-        # GOTO
-        if s.startswith("GOTO "):
-            tgt = s[len("GOTO "):].strip()
-            if tgt in label_map:
-                out_line = f"GOTO {label_map[tgt]}"
-
-        # GOSUB
-        elif s.startswith("GOSUB "):
-            tgt = s[len("GOSUB "):].strip()
-            if tgt in label_map:
-                out_line = f"GOSUB {label_map[tgt]}"
-
-        # IF ... THEN ...
-        elif s.startswith("IF "):
-            if "THEN" in s:
-                left, right = s.split("THEN", 1)
-                tgt = right.strip()
-                if tgt in label_map:
-                    out_line = f"{left}THEN {label_map[tgt]}"
-
-        final_code.append(out_line)
-
-    return final_code, label_map
+    label_lines: Dict[Label, int] = {}
+    for label, line in pairs:
+        if label not in label_lines:
+            label_lines[label] = line
+    return label_lines
+
+def split_ops(ops: List[Op]) -> Tuple[array, List[tuple]]:
+    """Columnar form of an op list: opcode bytes plus a parallel operand list"""
+    return array('B', [op[0] for op in ops]), [op[1] for op in ops]
+
+def format_jump(opcode: int, operands: tuple, line: str) -> str:
+    """GOTO/GOSUB/IF op rendered with its label replaced by line"""
+    if opcode == OP_IF:
+        return format_op(opcode, (operands[0], line))
+    return format_op(opcode, (line,))
+
+def named_label_map(label_lines: Dict[Label, int]) -> Dict[str, int]:
+    return {label_name(label): line for label, line in label_lines.items()}
 
 # ============================================================================
 # MAIN COMPILER
 # ============================================================================
 
 def compile_spl_with_antlr(source_code: str, output_file: str = None) -> bool:
-    """SPL compilation using ANTLR parser (fallbacks to handwritten if ANTLR unavailable)"""
+    """
+    SPL compilation using ANTLR parser (fallbacks to handwritten if ANTLR unavailable).
+    The first call looks for the ANTLR runtime and generated parser once and
+    rebinds this name to the matching implementation.
+    """
+    global compile_spl_with_antlr
     try:
         from antlr4 import InputStream, CommonTokenStream
         from SPLLexer import SPLLexer
         from SPLParser import SPLParser
         from SPLASTVisitor import SPLASTVisitor
-        ANTLR_AVAILABLE = True
     except Exception:
-        ANTLR_AVAILABLE = False
+        compile_spl_with_antlr = _compile_without_antlr
+    else:
+        compile_spl_with_antlr = _make_antlr_compiler(
+            InputStream, CommonTokenStream, SPLLexer, SPLParser, SPLASTVisitor)
+    return compile_spl_with_antlr(source_code, output_file)
 
-    if not ANTLR_AVAILABLE:
-        print("ANTLR not available! Falling back to hand-written parser.")
-        return compile_spl(source_code, output_file)
-    
-    try:
-        print("Phase 1-2: ANTLR Lexical and Syntax Analysis...")
-        input_stream = InputStream(source_code)
-        lexer = SPLLexer(input_stream)
-        stream = CommonTokenStream(lexer)
-        parser = SPLParser(stream)
-        tree = parser.spl_prog()
-        
-        symbol_table = SymbolTable()
-        visitor = SPLASTVisitor(symbol_table)
-        ast = visitor.visit(tree)
-        return continue_compilation(ast, symbol_table, output_file)
-        
-    except Exception as e:
-        print(f"ANTLR parsing failed: {e}")
-        return False
+def _compile_without_antlr(source_code: str, output_file: str = None) -> bool:
+    print("ANTLR not available! Falling back to hand-written parser.")
+    return compile_spl(source_code, output_file)
+
+def _make_antlr_compiler(InputStream, CommonTokenStream, SPLLexer, SPLParser, SPLASTVisitor):
+    # The ANTLR classes are bound once here instead of imported per call
+    def compile_with_antlr(source_code: str, output_file: str = None) -> bool:
+        try:
+            print("Phase 1-2: ANTLR Lexical and Syntax Analysis...")
+            input_stream = InputStream(source_code)
+            lexer = SPLLexer(input_stream)
+            stream = CommonTokenStream(lexer)
+            parser = SPLParser(stream)
+            tree = parser.spl_prog()
+            
+            symbol_table = SymbolTable()
+            visitor = SPLASTVisitor(symbol_table)
+            ast = visitor.visit(tree)
+            return continue_compilation(ast, symbol_table, output_file)
+            
+        except Exception as e:
+            print(f"ANTLR parsing failed: {e}")
+            return False
+    return compile_with_antlr
 
 def compile_spl(source_code: str, output_file: str = None) -> bool:
     print("Phase 1: Lexical Analysis...")
@@ -1936,7 +2747,7 @@ def compile_spl(source_code: str, output_file: str = None) -> bool:
 
 def continue_compilation(ast: ProgramNode, symbol_table: SymbolTable, output_file: str = None) -> bool:
     print("Phase 3: NAME-SCOPE-RULES Analysis...")
-    scope_analyzer = ScopeAnalyzer(ast, symbol_table)
+    scope_analyzer = SemanticAnalyzer(ast, symbol_table, verbose=True)
     scope_analyzer.analyze()
     scope_analyzer.print_symbol_table_report()
     
@@ -1947,8 +2758,7 @@ def continue_compilation(ast: ProgramNode, symbol_table: SymbolTable, output_fil
     else:
         print("\nVariable Naming and Function Naming accepted", end="\n\n")
     
-    type_analyzer = TypeAnalyzer(ast, symbol_table)
-    is_correctly_typed = type_analyzer.analyze()
+    is_correctly_typed = scope_analyzer.finish_type_analysis()
     
     if not is_correctly_typed or symbol_table.has_errors():
         print("Type error:")
@@ -1968,24 +2778,30 @@ def continue_compilation(ast: ProgramNode, symbol_table: SymbolTable, output_fil
         print(f"{i:4d}: {line}")
     
     print("\n=== PHASE 6: Processing Labels and Jumps ===")
-    final_code, label_map = process_labels_and_jumps(intermediate_code)
+    # Jumps were already numbered by the code generator
+    final_code = code_generator.final_code
+    label_map = named_label_map(code_generator.label_lines)
     
     if label_map:
         print("\nLabel Mapping:")
-        for label, line_num in sorted(label_map.items(), key=lambda x: x[1]):
+        # labels were numbered top to bottom, so the map is already in line order
+        for label, line_num in label_map.items():
             print(f"  {label:15s} -> Line {line_num}")
     else:
         print("No labels found in code.")
     
     print("\n=== FINAL EXECUTABLE CODE ===")
+    # final lines are rendered from ops, so they carry no surrounding
+    # whitespace and an empty check needs no strip
+    numbered: List[str] = []
     for i, line in enumerate(final_code, 1):
         print(f"{i:4d}: {line}")
+        if output_file and line:
+            numbered.append(f"{i}: {line}\n")
     
     if output_file:
         with open(output_file, 'w') as f:
-            for i, line in enumerate(final_code, 1):
-                if line.strip():
-                    f.write(f"{i}: {line}\n")
+            f.write(''.join(numbered))
         print(f"\nFinal executable code written to {output_file}")
     
     return True
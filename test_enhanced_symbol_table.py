@@ -97,7 +97,33 @@ def test_enhanced_crud():
     assert success == False, "❌ delete_symbol should return False for non-existent"
     print(f"   ✅ delete_symbol handles missing symbols: {success}")
     
-    print("\n5. CLEAR utility:")
+    print("\n5. CREATE in bulk:")
+    ids = st.reserve_node_ids(2)
+    assert list(ids) == [node2 + 1, node2 + 2], "❌ reserve_node_ids returned wrong range"
+    bulk = [SymbolInfo(name=n, node_id=i, scope=ScopeType.GLOBAL,
+                       var_type=VarType.TYPELESS, is_global=True)
+            for n, i in zip(["a", "b"], ids)]
+    result = st.add_symbols_bulk(bulk)
+    assert result == True, "❌ add_symbols_bulk should return True"
+    assert st.get_symbol(ids[0]).name == "a", "❌ bulk symbol not in symbols dict"
+    assert "b" in st.var_lookup, "❌ bulk symbol not in var_lookup"
+    result = st.add_symbols_bulk(bulk[:1])
+    assert result == False, "❌ add_symbols_bulk should return False for duplicate node_id"
+    print(f"   ✅ add_symbols_bulk inserted {len(bulk)} symbols")
+    
+    # Duplicate node_id inside one batch: the first entry wins, like add_symbol
+    (dup_id,) = st.reserve_node_ids(1)
+    batch = [SymbolInfo(name=n, node_id=dup_id, scope=ScopeType.GLOBAL,
+                        var_type=VarType.TYPELESS, is_global=True)
+             for n in ["c", "d"]]
+    result = st.add_symbols_bulk(batch)
+    assert result == False, "❌ add_symbols_bulk should return False for a duplicate inside the batch"
+    assert st.get_symbol(dup_id).name == "c", "❌ first symbol of the batch should be kept"
+    assert "d" not in st.var_lookup, "❌ rejected batch entry left in var_lookup"
+    assert st.lookup_var("d") is None, "❌ rejected batch entry left in the name index"
+    print(f"   ✅ add_symbols_bulk rejected duplicate node_id {dup_id} within the batch")
+
+    print("\n6. CLEAR utility:")
     st.clear()
     assert len(st.symbols) == 0, "❌ clear didn't empty symbols"
     assert len(st.var_lookup) == 0, "❌ clear didn't empty var_lookup"
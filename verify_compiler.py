@@ -8,6 +8,24 @@ import sys
 import os
 from compiler import *
 
+def generate_code(source_code):
+    """Run phases 1-5 on source_code and return the CodeGenerator"""
+    symbol_table = SymbolTable()
+    ast = Parser(Lexer(source_code).tokenize(), symbol_table).parse()
+    analyzer = SemanticAnalyzer(ast, symbol_table)
+    analyzer.analyze()
+    assert analyzer.finish_type_analysis() and not symbol_table.has_errors(), \
+        "test program should compile"
+    code_generator = CodeGenerator(ast, symbol_table)
+    code_generator.generate()
+    return code_generator
+
+def main_code(body, funcs=""):
+    """Intermediate code of a main with variables a b c x y z, after any functions"""
+    code = generate_code(
+        "glob { } proc { } func { %s } main { var { a b c x y z } %s }" % (funcs, body)).code
+    return code[code.index('gotomain:') + 1:] if funcs else code
+
 def test_symbol_table_crud():
     """Test CRUD operations on Symbol Table"""
     print("\n" + "="*70)
@@ -224,6 +242,188 @@ def test_error_detection():
     print("\n✅ Error Detection: WORKING")
     return True
 
+def test_cse_invalidation():
+    """Test that a reused TERM temp is dropped once one of its variables changes"""
+    print("\n" + "="*70)
+    print("TEST 6: Common Subexpression Invalidation")
+    print("="*70)
+    
+    # Unchanged operands: the second use reads the first temp
+    code = main_code("x = (plus a b); y = (plus a b); halt")
+    assert code == ['t1 = a + b', 'x = t1', 'y = t1', 'STOP'], code
+    print("✓ Repeated term reuses its temp")
+    
+    # Reassignment between the two uses
+    code = main_code("x = (plus a b); a = 5; y = (plus a b); halt")
+    assert code == ['t1 = a + b', 'x = t1', 'a = 5', 't2 = a + b', 'y = t2', 'STOP'], code
+    print("✓ Reassigned operand forces a recompute")
+    
+    # Assignment inside a loop body, before and after the reassignment
+    code = main_code("x = (plus a b); while (> x 0) { y = (plus a b); a = (minus a 1); "
+                     "z = (plus a b) }; y = (plus a b); halt")
+    assert code == ['t1 = a + b', 'x = t1', 'l1:', 'IF x > 0 THEN l2', 'GOTO l3', 'l2:',
+                    't2 = a + b', 'y = t2', 't3 = a - 1', 'a = t3', 't4 = a + b', 'z = t4',
+                    'GOTO l1', 'l3:', 't5 = a + b', 'y = t5', 'STOP'], code
+    print("✓ Loop body recomputes around its own assignment")
+    
+    # Assignment in either branch arm
+    for arms in ("{ a = 1 } else { c = 2 }", "{ c = 1 } else { b = 2 }"):
+        code = main_code("x = (plus a b); if (> x 0) %s; y = (plus a b); halt" % arms)
+        assert code[-3:] == ['t2 = a + b', 'y = t2', 'STOP'], code
+    print("✓ Assignment in a branch arm forces a recompute after the branch")
+    
+    # Call result assigned to an operand of a memoized term
+    func = "f(p) { local { } return p }"
+    code = main_code("x = (plus a b); a = f(x); y = (plus a b); halt", func)
+    assert code == ['t1 = a + b', 'x = t1', 'argf1 = x', 'GOSUB func_f', 'a = retf',
+                    't2 = a + b', 'y = t2', 'STOP'], code
+    code = main_code("y = (plus x 1); x = f(a); z = (plus x 1); halt", func)
+    assert code == ['t1 = x + 1', 'y = t1', 'argf1 = a', 'GOSUB func_f', 'x = retf',
+                    't2 = x + 1', 'z = t2', 'STOP'], code
+    print("✓ Call result assigned to a term operand forces a recompute")
+    
+    print("\n✅ CSE Invalidation: ALL TESTS PASSED")
+    return True
+
+def test_term_template_replay():
+    """Test that a cached TERM template is replayed with current operands"""
+    print("\n" + "="*70)
+    print("TEST 7: Term Template Replay")
+    print("="*70)
+    
+    # Every memoized part of the term reads a, so after a = 5 the whole
+    # term is replayed from its template with fresh temps
+    generator = generate_code("glob { } proc { } func { } main { var { a b c x y } "
+                              "x = (mult (plus a b) c); a = 5; y = (mult (plus a b) c); halt }")
+    assert generator._emit_cache, "term should leave a template"
+    assert generator.code == ['t1 = a + b', 't2 = t1 * c', 'x = t2', 'a = 5',
+                              't3 = a + b', 't4 = t3 * c', 'y = t4', 'STOP'], generator.code
+    print("✓ Template replayed after an operand was reassigned")
+    
+    # (plus a b) is still memoized after c = 5, so the template is skipped
+    code = main_code("x = (mult (plus a b) c); c = 5; y = (mult (plus a b) c); halt")
+    assert code == ['t1 = a + b', 't2 = t1 * c', 'x = t2', 'c = 5',
+                    't3 = t1 * c', 'y = t3', 'STOP'], code
+    print("✓ Template skipped while part of the term is still memoized")
+    
+    # g's template is replayed in h with h's variable names
+    body = "(a) { local { r } r = (mult (plus a 1) 2); return r }"
+    code = generate_code("glob { } proc { } func { g%s h%s } "
+                         "main { var { x } x = g(x); halt }" % (body, body)).code
+    assert code[3:6] == ['t1 = ga + 1', 't2 = t1 * 2', 'gr = t2'], code
+    assert code[9:12] == ['t3 = ha + 1', 't4 = t3 * 2', 'hr = t4'], code
+    print("✓ Replayed operands are renamed for the current owner")
+    
+    print("\n✅ Term Template Replay: ALL TESTS PASSED")
+    return True
+
+def test_constant_folding():
+    """Test constant TERM folding and folded conditions against expected output"""
+    print("\n" + "="*70)
+    print("TEST 8: Constant Condition Folding")
+    print("="*70)
+    
+    def num(value):
+        return AtomTermNode(atom=AtomNode(value=value, is_var=False))
+    
+    def binop(op, left, right):
+        return BinopTermNode(op=op, left=left, right=right)
+    
+    var = AtomTermNode(atom=AtomNode(value='x', is_var=True))
+    cases = [
+        (binop('minus', num(2), num(5)), -3),
+        (UnopTermNode(op='neg', term=binop('mult', num(3), num(4))), -12),
+        (binop('div', num(6), num(3)), None),
+        (binop('plus', num(1), binop('div', num(6), num(3))), None),
+        (binop('>', num(2), num(2)), False),
+        (binop('eq', binop('minus', num(2), num(5)), UnopTermNode(op='neg', term=num(3))), True),
+        (binop('eq', binop('>', num(2), num(1)), num(1)), None),
+        (binop('and', binop('>', num(3), num(1)), num(1)), None),
+        (UnopTermNode(op='not', term=num(0)), None),
+        (binop('>', var, num(1)), None),
+    ]
+    for term, expected in cases:
+        folded = fold_constant_term(term)
+        assert folded == expected and type(folded) is type(expected), (term, folded)
+    print(f"✓ fold_constant_term: {len(cases)} edge cases")
+    
+    test_file = 'test_folding.spl'
+    expected_file = 'verify_test_folding.txt'
+    output_file = 'temp_folding_output.txt'
+    with open(test_file, 'r') as f:
+        source_code = f.read()
+    
+    # The folded-false while leaves neither its body nor its labels
+    code = generate_code(source_code).code
+    assert code[:4] == ['x = 3', 'PRINT "taken"', 'PRINT "else"', 'PRINT "once"'], code
+    assert [line for line in code if line.endswith(':')] == \
+        ['l1:', 'l2:', 'l3:', 'l4:', 'l5:', 'l6:'], code
+    print("✓ Folded conditions left no labels")
+    
+    try:
+        compile_spl(source_code, output_file)
+        with open(output_file, 'r') as f:
+            output = f.read()
+    finally:
+        if os.path.exists(output_file):
+            os.remove(output_file)
+    with open(expected_file, 'r') as f:
+        expected = f.read()
+    assert output == expected, f"{test_file} output differs from {expected_file}"
+    print(f"✓ Output matches {expected_file}")
+    
+    print("\n✅ Constant Condition Folding: ALL TESTS PASSED")
+    return True
+
+def test_incremental_type_cache():
+    """Test that the type analyzer's def_cache only skips unchanged definitions"""
+    print("\n" + "="*70)
+    print("TEST 9: Incremental Type Analysis Cache")
+    print("="*70)
+    
+    template = ("glob { } proc { } func { f(a) { local { r } r = %s; return r } } "
+                "main { var { x } x = f(x); halt }")
+    def_cache = {}
+    
+    def type_check(body):
+        """Type-check one version of f with the shared cache"""
+        symbol_table = SymbolTable()
+        ast = Parser(Lexer(template % body).tokenize(), symbol_table).parse()
+        SemanticAnalyzer(ast, symbol_table).analyze()
+        assert not symbol_table.has_errors(), symbol_table.errors
+        analyzer = TypeAnalyzer(ast, symbol_table, def_cache=def_cache)
+        checked = []
+        check_body = analyzer.check_body
+        def counting_check_body(local_vars, body):
+            checked.append(body)
+            return check_body(local_vars, body)
+        analyzer.check_body = counting_check_body
+        return analyzer.analyze(), len(checked), list(symbol_table.errors)
+    
+    typed, checked, errors = type_check("(plus a 1)")
+    assert typed and checked == 1 and not errors, (typed, checked, errors)
+    assert len(def_cache) == 1, def_cache
+    print("✓ First version checked and cached")
+    
+    # Fresh parse of the same source: f's body is not checked again
+    typed, checked, errors = type_check("(plus a 1)")
+    assert typed and checked == 0 and not errors, (typed, checked, errors)
+    print("✓ Unchanged definition hits the cache")
+    
+    # Changed body with a type error: f is checked again and the error reported
+    typed, checked, errors = type_check("(> a 1)")
+    assert not typed and checked == 1 and errors, (typed, checked, errors)
+    assert len(def_cache) == 1, def_cache
+    print(f"✓ Changed definition misses the cache: {errors[-1]}")
+    
+    # Failures are not cached, so the same error is reported again
+    typed, checked, errors = type_check("(> a 1)")
+    assert not typed and errors, (typed, checked, errors)
+    print("✓ Ill-typed definition is re-checked on the next run")
+    
+    print("\n✅ Incremental Type Cache: ALL TESTS PASSED")
+    return True
+
 def main():
     """Run all verification tests"""
     print("\n" + "="*70)
@@ -236,6 +436,10 @@ def main():
         ("Compilation Phases", test_compilation_phases),
         ("Line Numbering", test_line_numbering),
         ("Error Detection", test_error_detection),
+        ("CSE Invalidation", test_cse_invalidation),
+        ("Term Template Replay", test_term_template_replay),
+        ("Constant Condition Folding", test_constant_folding),
+        ("Incremental Type Cache", test_incremental_type_cache),
     ]
     
     results = []